@@ -0,0 +1,121 @@
+"""
+Two-tier cache for resized welcome avatars.
+
+A bounded in-memory LRU sits in front of an on-disk directory with TTL
+eviction. Entries are stored already resized to the card's avatar size, so a
+hit skips both the CDN download and the resize.
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+
+
+class AvatarCache:
+    def __init__(self, cache_dir, max_items=256, ttl=7 * 24 * 3600):
+        self.cache_dir = cache_dir
+        self.max_items = max(1, max_items)
+        self.ttl = ttl
+
+        self.memory = OrderedDict()  # key -> resized avatar PNG bytes
+        self.memory_bytes = 0
+
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+        }
+
+    @staticmethod
+    def make_key(avatar_hash, size):
+        return f"{avatar_hash}_{size[0]}x{size[1]}"
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.png")
+
+    async def get(self, key):
+        """Return cached avatar bytes or None; disk reads run off the event loop"""
+        data = self.memory.get(key)
+        if data is not None:
+            self.memory.move_to_end(key)
+            self.stats["memory_hits"] += 1
+            return data
+
+        data = await asyncio.to_thread(self._read_disk, key)
+        if data is None:
+            self.stats["misses"] += 1
+            return None
+
+        self.stats["disk_hits"] += 1
+        self._remember(key, data)
+        return data
+
+    async def put(self, key, data):
+        self._remember(key, data)
+        await asyncio.to_thread(self._write_disk, key, data)
+
+    def _remember(self, key, data):
+        old = self.memory.pop(key, None)
+        if old is not None:
+            self.memory_bytes -= len(old)
+        self.memory[key] = data
+        self.memory_bytes += len(data)
+
+        while len(self.memory) > self.max_items:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_bytes -= len(evicted)
+            self.stats["memory_evictions"] += 1
+
+    def _read_disk(self, key):
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                os.remove(path)
+                self.stats["disk_evictions"] += 1
+                return None
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write_disk(self, key, data):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Write then rename so a crash never leaves a truncated avatar behind
+            tmp_path = self._path(key) + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            print(f"⚠️  Could not write avatar cache entry {key}: {e}")
+
+    def prune(self):
+        """Remove expired files from the disk tier (blocking, run in a thread)"""
+        removed = 0
+        now = time.time()
+        try:
+            entries = list(os.scandir(self.cache_dir))
+        except OSError:
+            return 0
+        for entry in entries:
+            try:
+                if now - entry.stat().st_mtime > self.ttl:
+                    os.remove(entry.path)
+                    removed += 1
+            except OSError:
+                pass
+        self.stats["disk_evictions"] += removed
+        return removed
+
+    def status(self):
+        lookups = self.stats["memory_hits"] + self.stats["disk_hits"] + self.stats["misses"]
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        return {
+            "items": len(self.memory),
+            "max_items": self.max_items,
+            "memory_bytes": self.memory_bytes,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            **self.stats,
+        }
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Offline micro-benchmarks for the moderation content filters.
+
+Compares the old per-keyword substring loop with the compiled KeywordMatcher,
+and the old per-domain URL substring loop with the hashed DomainBlocklist, on
+synthetic lists and chat messages, reporting the per-message cost as the
+lists grow.
+
+    python benchmark_moderation.py                        # every suite
+    python benchmark_moderation.py --suites keywords --keywords 50 5000 --messages 5000
+    python benchmark_moderation.py --suites domains --domains 1000 1000000
+"""
+import argparse
+import random
+import re
+import string
+import sys
+import time
+
+from content_filter import DomainBlocklist, KeywordMatcher, url_hosts
+
+DEFAULT_KEYWORD_COUNTS = [20, 1000, 10000]
+DEFAULT_DOMAIN_COUNTS = [1000, 10000, 100000]
+TLDS = ["com", "net", "org", "io", "xxx", "co.uk"]
+
+
+def random_word(rng, min_len=3, max_len=9):
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(min_len, max_len)))
+
+
+def make_keywords(rng, count):
+    keywords = set()
+    while len(keywords) < count:
+        keywords.add(random_word(rng, 4, 10))
+    return sorted(keywords)
+
+
+def make_messages(rng, count, keywords, hit_rate=0.1):
+    """Chat-sized messages (5-40 words); `hit_rate` of them contain a keyword"""
+    vocabulary = [random_word(rng) for _ in range(2000)]
+    messages = []
+    for _ in range(count):
+        words = rng.choices(vocabulary, k=rng.randint(5, 40))
+        if rng.random() < hit_rate:
+            words.insert(rng.randrange(len(words) + 1), rng.choice(keywords))
+        messages.append(" ".join(words))
+    return messages
+
+
+def time_per_message(check, messages):
+    """Microseconds per message and the number of messages flagged"""
+    started = time.perf_counter()
+    hits = sum(1 for message in messages if check(message))
+    return (time.perf_counter() - started) / len(messages) * 1e6, hits
+
+
+def keyword_loop(keywords):
+    """The filter as it was: one substring search per keyword"""
+    def check(content):
+        content = content.lower()
+        for keyword in keywords:
+            if keyword in content:
+                return keyword
+        return None
+    return check
+
+
+def bench_keywords(counts, message_count, seed):
+    print(f"{'keywords':>9}  {'method':<26}{'build ms':>10}{'us/msg':>10}{'flagged':>9}")
+    print("-" * 66)
+    for count in counts:
+        rng = random.Random(seed)
+        keywords = make_keywords(rng, count)
+        messages = make_messages(rng, message_count, keywords)
+
+        methods = [("substring loop (old)", lambda: keyword_loop(keywords))]
+        for label, kwargs in [
+            ("matcher substring", {"word_boundary": False}),
+            ("matcher whole-word", {"word_boundary": True}),
+            ("matcher whole-word + leet", {"word_boundary": True, "leetspeak": True}),
+        ]:
+            methods.append((label, lambda kwargs=kwargs: KeywordMatcher(keywords, **kwargs).search))
+
+        for label, build in methods:
+            re.purge()  # Don't let the re module's cache hide compile time
+            started = time.perf_counter()
+            check = build()
+            build_ms = (time.perf_counter() - started) * 1000
+            us, hits = time_per_message(check, messages)
+            print(f"{count:>9}  {label:<26}{build_ms:>10.1f}{us:>10.1f}{hits:>9}")
+        print()
+
+
+def domain_loop(domains):
+    """The filter as it was: compile the URL regex, then substring-check every domain"""
+    def check(content):
+        content = content.lower()
+        url_pattern = re.compile(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+')
+        for url in url_pattern.findall(content):
+            for domain in domains:
+                if domain in url.lower():
+                    return domain
+        return None
+    return check
+
+
+def blocklist_check(blocklist):
+    def check(content):
+        for host in url_hosts(content.lower()):
+            domain = blocklist.match(host)
+            if domain:
+                return domain
+        return None
+    return check
+
+
+def make_link_messages(rng, count, domains, hit_rate=0.1):
+    """Chat messages with 0-3 links; `hit_rate` of the links point at (a subdomain of) a blocked domain"""
+    vocabulary = [random_word(rng) for _ in range(2000)]
+    messages = []
+    for _ in range(count):
+        words = rng.choices(vocabulary, k=rng.randint(5, 30))
+        for _ in range(rng.randint(0, 3)):
+            if rng.random() < hit_rate:
+                host = f"{random_word(rng)}.{rng.choice(domains)}"
+            else:
+                host = f"www.{random_word(rng, 5, 12)}.{rng.choice(TLDS)}"
+            words.insert(rng.randrange(len(words) + 1), f"https://{host}/{random_word(rng)}?id={rng.randint(1, 9999)}")
+        messages.append(" ".join(words))
+    return messages
+
+
+def bench_domains(counts, message_count, seed):
+    print(f"{'domains':>9}  {'method':<26}{'build ms':>10}{'memory KB':>11}{'us/msg':>10}{'flagged':>9}")
+    print("-" * 77)
+    for count in counts:
+        rng = random.Random(seed)
+        domains = sorted({f"{random_word(rng, 5, 14)}.{rng.choice(TLDS)}" for _ in range(count)})
+        messages = make_link_messages(rng, message_count, domains)
+
+        # The old loop is O(domains) per link, so time it on fewer messages at large sizes
+        loop_messages = messages[:max(50, message_count * 1000 // count)]
+        strings_kb = (sys.getsizeof(domains) + sum(sys.getsizeof(d) for d in domains)) // 1024
+        us, hits = time_per_message(domain_loop(domains), loop_messages)
+        print(f"{count:>9}  {'substring loop (old)':<26}{0:>10.1f}{strings_kb:>11}{us:>10.1f}{hits:>9}  ({len(loop_messages)} msgs)")
+
+        started = time.perf_counter()
+        blocklist = DomainBlocklist(domains)
+        build_ms = (time.perf_counter() - started) * 1000
+        us, hits = time_per_message(blocklist_check(blocklist), messages)
+        print(f"{count:>9}  {'hashed suffix lookup':<26}{build_ms:>10.1f}{blocklist.nbytes // 1024:>11}{us:>10.1f}{hits:>9}")
+        print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline moderation filter benchmark")
+    parser.add_argument("--suites", nargs="+", choices=["keywords", "domains"], default=["keywords", "domains"])
+    parser.add_argument("--keywords", nargs="+", type=int, default=DEFAULT_KEYWORD_COUNTS, help="keyword list sizes")
+    parser.add_argument("--domains", nargs="+", type=int, default=DEFAULT_DOMAIN_COUNTS, help="domain blocklist sizes")
+    parser.add_argument("--messages", type=int, default=2000, help="synthetic messages per list size")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    if "keywords" in args.suites:
+        bench_keywords(args.keywords, args.messages, args.seed)
+    if "domains" in args.suites:
+        bench_domains(args.domains, args.messages, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark for the welcome card render path.
+
+Renders synthetic avatars (PNG, JPEG and animated GIF at several sizes)
+through the same WelcomeRenderer pool the bot uses, without touching Discord,
+and reports p50/p95/p99 latency, peak RSS and output bytes per encoding and
+pool configuration. Each configuration runs in a fresh interpreter so peak
+RSS numbers don't bleed into each other.
+
+    python benchmark_welcome.py                 # full matrix
+    python benchmark_welcome.py --runs 10 --pools thread:2 --encodings webp
+    python benchmark_welcome.py --encode-report # encode time vs size only
+"""
+import argparse
+import asyncio
+import json
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from io import BytesIO
+
+from PIL import Image
+
+from welcome_card import CardLayout, WelcomeRenderer, encode_image, downscale, get_template
+
+LAYOUT = CardLayout(
+    background_path="./assets/OG_Welcome.png",
+    font_path="./assets/arial.ttf",
+    avatar_size=(170, 170),
+    avatar_position=(836, 798),
+    text="",
+    text_position=(130, 270),
+    text_font_size=38,
+    text_color="white",
+)
+
+# (label, encoding, quality, compress_level, target_width)
+ENCODING_MODES = [
+    ("png level 1", "png", 80, 1, 0),
+    ("png level 6 (default)", "png", 80, 6, 0),
+    ("png level 9", "png", 80, 9, 0),
+    ("png-quantized", "png-quantized", 80, 6, 0),
+    ("webp q90", "webp", 90, 6, 0),
+    ("webp q80", "webp", 80, 6, 0),
+    ("webp q60", "webp", 60, 6, 0),
+    ("webp q80 @ 768px", "webp", 80, 6, 768),
+    ("png-quantized @ 512px", "png-quantized", 80, 6, 512),
+]
+
+# Encodings and pools exercised by the render matrix by default
+DEFAULT_ENCODINGS = ["png", "png-quantized", "webp"]
+DEFAULT_POOLS = ["thread:1", "thread:2", "thread:4", "process:2"]
+
+AVATAR_SIZES = [128, 512, 1024]
+AVATAR_FORMATS = ["PNG", "JPEG", "GIF"]
+
+
+def synthetic_avatar(size=(256, 256), fmt="PNG"):
+    """Gradient avatar so the encoder sees something closer to a real photo than a flat fill"""
+    img = Image.linear_gradient("L").resize(size).convert("RGB")
+    img = Image.merge("RGB", (img.getchannel(0), img.rotate(90).getchannel(0), img.rotate(180).getchannel(0)))
+    buffer = BytesIO()
+    if fmt == "GIF":
+        # Animated: the renderer only ever uses the first frame
+        frames = [img.rotate(angle) for angle in (0, 90, 180, 270)]
+        frames[0].save(buffer, format="GIF", save_all=True, append_images=frames[1:], duration=100, loop=0)
+    else:
+        img.save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def synthetic_avatars():
+    return {
+        f"{fmt.lower()}-{size}": synthetic_avatar((size, size), fmt)
+        for fmt in AVATAR_FORMATS
+        for size in AVATAR_SIZES
+    }
+
+
+class OfflineRenderer(WelcomeRenderer):
+    """WelcomeRenderer whose "downloads" come from in-memory synthetic avatars"""
+
+    def __init__(self, avatars, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.avatars = avatars
+
+    async def fetch_avatar(self, url):
+        return self.avatars[url]
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[rank]
+
+
+def peak_rss_mb():
+    """Peak RSS of this process plus the largest reaped pool worker, in MB (Linux reports KB)"""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return (own + children) / 1024
+
+
+async def run_config(encoding, pool, runs):
+    kind, workers = pool.split(":")
+    avatars = synthetic_avatars()
+    layout = LAYOUT._replace(encoding=encoding)
+    renderer = OfflineRenderer(
+        avatars,
+        layout,
+        workers=int(workers),
+        max_pending=runs,
+        timeout=600,
+        use_processes=kind == "process",
+    )
+    await renderer.start()
+
+    names = list(avatars)
+    latencies = []
+    sizes = []
+
+    async def one(i):
+        started = time.perf_counter()
+        card = await renderer.render(names[i % len(names)])
+        latencies.append((time.perf_counter() - started) * 1000)
+        sizes.append(len(card.getbuffer()))
+
+    executor = renderer.executor
+    try:
+        # Submit everything at once like a join burst; latency includes queueing
+        await asyncio.gather(*(one(i) for i in range(runs)))
+    finally:
+        await renderer.close()
+        # Reap process workers so their peak RSS shows up in RUSAGE_CHILDREN
+        executor.shutdown(wait=True)
+
+    latencies.sort()
+    return {
+        "encoding": encoding,
+        "pool": pool,
+        "runs": runs,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "rss_mb": peak_rss_mb(),
+        "bytes": int(statistics.mean(sizes)),
+    }
+
+
+def run_matrix(encodings, pools, runs):
+    print(f"{'encoding':<16}{'pool':<12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'peak RSS MB':>14}{'bytes':>12}")
+    print("-" * 84)
+    for encoding in encodings:
+        for pool in pools:
+            child = subprocess.run(
+                [sys.executable, __file__, "--child", encoding, pool, str(runs)],
+                capture_output=True,
+                text=True,
+            )
+            if child.returncode != 0:
+                print(f"{encoding:<16}{pool:<12}❌ failed: {child.stderr.strip().splitlines()[-1:]}")
+                continue
+            r = json.loads(child.stdout.strip().splitlines()[-1])
+            print(f"{encoding:<16}{pool:<12}{r['p50']:>10.1f}{r['p95']:>10.1f}{r['p99']:>10.1f}{r['rss_mb']:>14.1f}{r['bytes']:>12,}")
+
+
+def composed_card():
+    """Render the card once and return the composited image before encoding"""
+    template = get_template(LAYOUT)
+    avatar = Image.open(BytesIO(synthetic_avatar())).convert("RGBA").resize(LAYOUT.avatar_size)
+    avatar.putalpha(template.mask)
+    card = template.background.copy()
+    card.paste(avatar, LAYOUT.avatar_position, avatar)
+    return card
+
+
+def report_encodings(runs=5):
+    card = composed_card()
+    print(f"{'mode':<24}{'median ms':>12}{'bytes':>12}")
+    print("-" * 48)
+    for label, encoding, quality, compress_level, width in ENCODING_MODES:
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            data = encode_image(downscale(card, width), encoding, quality, compress_level)
+            timings.append((time.perf_counter() - started) * 1000)
+        print(f"{label:<24}{statistics.median(timings):>12.1f}{len(data):>12,}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline welcome card render benchmark")
+    parser.add_argument("--runs", type=int, default=20, help="renders per configuration")
+    parser.add_argument("--encodings", nargs="+", default=DEFAULT_ENCODINGS)
+    parser.add_argument("--pools", nargs="+", default=DEFAULT_POOLS, help="e.g. thread:2 process:4")
+    parser.add_argument("--encode-report", action="store_true", help="only report encode time vs size")
+    parser.add_argument("--child", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        encoding, pool, runs = args.child
+        print(json.dumps(asyncio.run(run_config(encoding, pool, int(runs)))))
+    elif args.encode_report:
+        report_encodings()
+    else:
+        run_matrix(args.encodings, args.pools, args.runs)
+
+
+if __name__ == "__main__":
+    main()
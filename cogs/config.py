@@ -0,0 +1,142 @@
+import os
+import discord
+from discord.ext import commands
+from discord import app_commands
+
+ASSETS_DIR = "./assets"
+
+FEATURES = {
+    "welcome": "welcome_enabled",
+    "leave": "leave_enabled",
+    "stats": "stats_enabled",
+    "moderation": "moderation_enabled",
+}
+
+class GuildConfig(commands.Cog):
+    config = app_commands.Group(name="config", description="Configure the bot for this server")
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+
+    @property
+    def store(self):
+        return self.bot.guild_config
+
+    async def _require_admin(self, interaction: discord.Interaction):
+        if not interaction.user.guild_permissions.administrator:
+            await interaction.response.send_message(
+                "❌ You need administrator permissions to configure the bot.",
+                ephemeral=True
+            )
+            return False
+        return True
+
+    def _settings_embed(self, guild):
+        settings = self.store.get(guild.id)
+
+        def channel_text(channel_id):
+            return f"<#{channel_id}>" if channel_id else "Not set"
+
+        embed = discord.Embed(
+            title=f"🔧 Configuration for {guild.name}",
+            color=discord.Color.blue()
+        )
+        embed.add_field(
+            name="📢 Channels",
+            value=f"• Welcome: {channel_text(settings['welcome_channel_id'])}\n• Leaving: {channel_text(settings['leaving_channel_id'])}\n• Mod log: {channel_text(settings['modlog_channel_id'])}",
+            inline=False
+        )
+        embed.add_field(
+            name="🛡️ Moderation",
+            value=f"• Spam Threshold: {settings['spam_threshold']} messages\n• Spam Timeframe: {settings['spam_timeframe']} seconds",
+            inline=False
+        )
+        embed.add_field(name="🖼️ Welcome Template", value=settings["template"], inline=False)
+        embed.add_field(
+            name="⚙️ Features",
+            value="\n".join(
+                f"{'✅' if settings[key] else '❌'} {name.title()}" for name, key in FEATURES.items()
+            ),
+            inline=False
+        )
+        return embed
+
+    @config.command(name="show", description="Show this server's bot configuration")
+    async def show(self, interaction: discord.Interaction):
+        if not await self._require_admin(interaction):
+            return
+        await interaction.response.send_message(embed=self._settings_embed(interaction.guild), ephemeral=True)
+
+    @config.command(name="channels", description="Set the welcome, leaving and mod log channels")
+    @app_commands.describe(
+        welcome="Channel for welcome messages",
+        leaving="Channel for leave messages",
+        modlog="Channel for moderation notices (default: #mod-logs or #moderation)"
+    )
+    async def channels(self, interaction: discord.Interaction, welcome: discord.TextChannel = None, leaving: discord.TextChannel = None, modlog: discord.TextChannel = None):
+        if not await self._require_admin(interaction):
+            return
+
+        if welcome:
+            self.store.set(interaction.guild.id, "welcome_channel_id", welcome.id)
+        if leaving:
+            self.store.set(interaction.guild.id, "leaving_channel_id", leaving.id)
+        if modlog:
+            self.store.set(interaction.guild.id, "modlog_channel_id", modlog.id)
+        await interaction.response.send_message(embed=self._settings_embed(interaction.guild), ephemeral=True)
+
+    @config.command(name="moderation", description="Set spam detection thresholds for this server")
+    @app_commands.describe(
+        spam_threshold="Number of messages before spam detection (3-20)",
+        spam_timeframe="Timeframe in seconds for spam detection (5-60)"
+    )
+    async def moderation(self, interaction: discord.Interaction, spam_threshold: int = None, spam_timeframe: int = None):
+        if not await self._require_admin(interaction):
+            return
+
+        if spam_threshold:
+            self.store.set(interaction.guild.id, "spam_threshold", max(3, min(20, spam_threshold)))
+        if spam_timeframe:
+            self.store.set(interaction.guild.id, "spam_timeframe", max(5, min(60, spam_timeframe)))
+        await interaction.response.send_message(embed=self._settings_embed(interaction.guild), ephemeral=True)
+
+    @config.command(name="template", description="Choose the welcome card background")
+    @app_commands.describe(name="Template name (a PNG in the assets folder, without .png)")
+    async def template(self, interaction: discord.Interaction, name: str):
+        if not await self._require_admin(interaction):
+            return
+
+        available = sorted(f[:-4] for f in os.listdir(ASSETS_DIR) if f.lower().endswith(".png"))
+        if name not in available:
+            await interaction.response.send_message(
+                f"❌ Unknown template `{name}`. Available: {', '.join(available) or 'none'}",
+                ephemeral=True
+            )
+            return
+
+        self.store.set(interaction.guild.id, "template", name)
+        await interaction.response.send_message(embed=self._settings_embed(interaction.guild), ephemeral=True)
+
+    @config.command(name="feature", description="Turn a bot feature on or off for this server")
+    @app_commands.describe(feature="Feature to toggle", enabled="Whether the feature is on")
+    @app_commands.choices(feature=[
+        app_commands.Choice(name=name.title(), value=name) for name in FEATURES
+    ])
+    async def feature(self, interaction: discord.Interaction, feature: app_commands.Choice[str], enabled: bool):
+        if not await self._require_admin(interaction):
+            return
+
+        self.store.set(interaction.guild.id, FEATURES[feature.value], enabled)
+        await interaction.response.send_message(embed=self._settings_embed(interaction.guild), ephemeral=True)
+
+    @config.command(name="reset", description="Reset this server's configuration to defaults")
+    async def reset(self, interaction: discord.Interaction):
+        if not await self._require_admin(interaction):
+            return
+
+        self.store.reset(interaction.guild.id)
+        await interaction.response.send_message(embed=self._settings_embed(interaction.guild), ephemeral=True)
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(GuildConfig(bot))
+    print("✅ Config cog loaded with /config commands")
@@ -1,36 +1,81 @@
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord import app_commands
+import os
 import re
+import sys
+import time
 import asyncio
-from datetime import datetime, timedelta
-from collections import defaultdict, deque
+from datetime import timedelta
 import aiohttp
+from content_filter import DomainBlocklist, KeywordMatcher, url_hosts
+from mod_actions import NOTICE, TIMEOUT, ModActionExecutor
+from notice_scheduler import NoticeScheduler
+from spam_tracker import MODES as SPAM_MODES, RecentMessages, SpamTracker, WarningCounter, key_bytes
+
+# Keyword list for the NSFW filter (one term per line, see content_filter.py)
+NSFW_KEYWORDS_FILE = os.getenv("NSFW_KEYWORDS_FILE", "./assets/nsfw_keywords.txt")
+NSFW_WORD_BOUNDARY = os.getenv("NSFW_WORD_BOUNDARY", "1") == "1"  # "0" = plain substring matching
+NSFW_LEETSPEAK = os.getenv("NSFW_LEETSPEAK", "0") == "1"  # Fold p0rn/$ex style spellings
+# Blocked link domains (subdomains included); the built-in list is always blocked too
+NSFW_DOMAINS_FILE = os.getenv("NSFW_DOMAINS_FILE", "./assets/nsfw_domains.txt")
+# Spam detection: "window" (sliding window) or "bucket" (token bucket, smoother burst tolerance)
+SPAM_DETECTION_MODE = os.getenv("SPAM_DETECTION_MODE", "window")
+if SPAM_DETECTION_MODE not in SPAM_MODES:
+    print(f"⚠️  Unknown SPAM_DETECTION_MODE '{SPAM_DETECTION_MODE}', using window")
+    SPAM_DETECTION_MODE = "window"
+# Per-user state is dropped after this many idle seconds (never below the 60 s max spam timeframe)
+MODERATION_STATE_TTL = max(60.0, float(os.getenv("MODERATION_STATE_TTL", "600")))
+MODERATION_SWEEP_SECONDS = float(os.getenv("MODERATION_SWEEP_SECONDS", "60"))
+# Each warning expires after this long without a new one
+WARNING_DECAY_MINUTES = float(os.getenv("WARNING_DECAY_MINUTES", "60"))
+# Recent message IDs kept per member and channel, so spam is deleted without fetching history
+SPAM_DELETE_BUFFER = int(os.getenv("SPAM_DELETE_BUFFER", "20"))
+# Workers draining the moderation action queue (deletes, then timeouts, then notices)
+MOD_ACTION_WORKERS = int(os.getenv("MOD_ACTION_WORKERS", "2"))
+# Pending notice deletions, kept on disk so they still happen after a restart
+NOTICE_SCHEDULE_DB = os.getenv("NOTICE_SCHEDULE_DB", "./data/notice_schedule.db")
 
 class ModerationCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         
-        # Spam tracking
-        self.user_messages = defaultdict(lambda: deque(maxlen=10))
-        self.user_warnings = defaultdict(int)
+        # Spam tracking (message rate per guild member, on monotonic time)
+        self.spam_tracker = SpamTracker(SPAM_DETECTION_MODE)
+        self.recent_messages = RecentMessages(SPAM_DELETE_BUFFER)
+        self.delete_stats = {
+            "incidents": 0,
+            "buffer_deletes": 0,
+            "history_fallbacks": 0,
+            "rest_calls_saved": 0,
+        }
+
+        # Deletes, timeouts and notices all go through one prioritized queue
+        self.actions = ModActionExecutor(workers=MOD_ACTION_WORKERS)
+        self.user_warnings = WarningCounter(WARNING_DECAY_MINUTES * 60)
         
         # Prevent multiple violations from same user at once
         self.processing_users = set()  # Track users currently being processed
-        self.user_locks = defaultdict(asyncio.Lock)  # Per-user locks
+        self.user_locks = {}  # (guild_id, user_id) -> asyncio.Lock, dropped once the user goes idle
+        self.timed_out_until = {}  # (guild_id, user_id) -> end of the timeout we applied, dropped once it's over
+        self.state_stats = {"sweeps": 0, "expired": 0}
         
-        # Configuration
+        # Configuration (defaults; per-guild values live in the bot's guild config store)
         self.spam_threshold = 5  # messages
         self.spam_timeframe = 10  # seconds
         self.max_warnings = 3
         
-        # Track warning messages to prevent deletion
-        self.warning_messages = set()
+        # Warning/timeout notices waiting to be deleted (also protects them from spam purges)
+        self.notices = NoticeScheduler(NOTICE_SCHEDULE_DB, self.expire_notices)
+
+        # Where timeout notices go: guild_id -> (configured channel id, resolved channel id, temporary)
+        self.modlog_targets = {}
+        self.modlog_stats = {"hits": 0, "misses": 0, "invalidations": 0}
         
         # Regex patterns for detection
         self.invite_pattern = re.compile(r'(discord\.gg/|discord\.com/invite/|discordapp\.com/invite/)', re.IGNORECASE)
         
-        # 18+ keywords (add more as needed)
+        # 18+ keywords, used when the keyword file can't be read
         self.nsfw_keywords = [
             'porn', 'xxx', 'sex', 'nude', 'naked', 'nsfw', 'adult', 'erotic',
             'hentai', 'lesbian', 'gay', 'masturbate', 'orgasm', 'penis', 'vagina',
@@ -43,16 +88,218 @@ class ModerationCog(commands.Cog):
             'tube8.com', 'spankbang.com', 'xhamster.com', 'onlyfans.com'
         ]
 
+        # All keywords compiled into one matcher, so each message is scanned once
+        self.keyword_matcher = self.load_keyword_matcher()
+        self.domain_blocklist = self.load_domain_blocklist()
+
+    def load_keyword_matcher(self):
+        try:
+            matcher = KeywordMatcher.from_file(
+                NSFW_KEYWORDS_FILE, word_boundary=NSFW_WORD_BOUNDARY, leetspeak=NSFW_LEETSPEAK
+            )
+            print(f"✅ Loaded {len(matcher)} NSFW keywords from {NSFW_KEYWORDS_FILE}")
+            return matcher
+        except OSError as e:
+            print(f"⚠️  Could not read NSFW keywords file {NSFW_KEYWORDS_FILE}: {e}; using built-in list")
+            return KeywordMatcher(self.nsfw_keywords, word_boundary=NSFW_WORD_BOUNDARY, leetspeak=NSFW_LEETSPEAK)
+
+    def load_domain_blocklist(self):
+        try:
+            blocklist = DomainBlocklist.from_file(NSFW_DOMAINS_FILE, extra=self.nsfw_domains)
+            print(f"✅ Loaded {len(blocklist)} blocked domains ({blocklist.nbytes // 1024} KB) from {NSFW_DOMAINS_FILE}")
+            return blocklist
+        except OSError as e:
+            print(f"⚠️  Could not read blocked domains file {NSFW_DOMAINS_FILE}: {e}; using built-in list")
+            return DomainBlocklist(self.nsfw_domains)
+
+    async def cog_load(self):
+        await self.restore_warnings()
+        restored = self.notices.load()
+        if restored:
+            print(f"⏳ Restored {restored} pending notice deletion(s)")
+        self.actions.start()
+        # Channels aren't cached until the bot is ready
+        self.notices.start(wait=self.bot.wait_until_ready)
+        self.sweep_state.start()
+
+    async def cog_unload(self):
+        self.sweep_state.cancel()
+        await self.notices.close()
+        await self.actions.close()
+
+    def expire_notices(self, channel_id, message_ids):
+        """Queue the deletion of notices that have come due (lowest priority, one bulk delete per channel)"""
+        channel = self.bot.get_channel(channel_id)
+        if channel is None:
+            return  # Channel is gone or no longer visible
+        for message_id in message_ids:
+            self.actions.delete(channel, message_id, priority=NOTICE)
+
+    @tasks.loop(seconds=MODERATION_SWEEP_SECONDS)
+    async def sweep_state(self):
+        """Drop per-user state for members who have gone quiet"""
+        expired = self.spam_tracker.sweep(MODERATION_STATE_TTL) + self.user_warnings.sweep()
+        expired += self.recent_messages.sweep(MODERATION_STATE_TTL)
+        idle_locks = [
+            key for key, lock in self.user_locks.items()
+            if not lock.locked() and key not in self.spam_tracker
+        ]
+        for key in idle_locks:
+            del self.user_locks[key]
+        now = discord.utils.utcnow()
+        ended = [key for key, until in self.timed_out_until.items() if until <= now]
+        for key in ended:
+            del self.timed_out_until[key]
+        self.state_stats["sweeps"] += 1
+        self.state_stats["expired"] += expired + len(idle_locks) + len(ended)
+
+    def state_status(self):
+        """How many users the cog holds state for, and roughly how many bytes it takes"""
+        spam = self.spam_tracker.status()
+        warnings = self.user_warnings.status()
+        recent = self.recent_messages.status()
+        lock_bytes = sys.getsizeof(self.user_locks) + sum(
+            key_bytes(key) + sys.getsizeof(lock) + sys.getsizeof(vars(lock))
+            for key, lock in self.user_locks.items()
+        )
+        users = set(self.spam_tracker.windows) | set(self.spam_tracker.buckets)
+        users |= set(self.user_warnings.entries) | set(self.user_locks)
+        users |= {(guild_id, user_id) for guild_id, _, user_id in self.recent_messages.buffers}
+        return {
+            "tracked_users": len(users),
+            "spam_tracked": spam["tracked"],
+            "warned": warnings["tracked"],
+            "locks": len(self.user_locks),
+            "message_ids": recent["message_ids"],
+            "bytes": spam["bytes"] + warnings["bytes"] + recent["bytes"] + lock_bytes,
+            "ttl": MODERATION_STATE_TTL,
+            "deletes": dict(self.delete_stats),
+            "actions": self.actions.status(),
+            "notices": self.notices.status(),
+            "modlog": {"cached": len(self.modlog_targets), **self.modlog_stats},
+            **self.state_stats,
+        }
+
+    @property
+    def ledger(self):
+        """The bot's durable infraction ledger (None when running without one)"""
+        return getattr(self.bot, "infractions", None)
+
+    def record_infraction(self, guild_id, user_id, kind, reason, action, warning_count=None):
+        if self.ledger is not None:
+            self.ledger.record(guild_id, user_id, kind, reason, action, warning_count)
+
+    async def restore_warnings(self):
+        """Reload warning counts of recently warned members so a restart doesn't wipe them"""
+        if self.ledger is None:
+            return
+        # Older counts have fully decayed by now
+        horizon = self.max_warnings * WARNING_DECAY_MINUTES * 60
+        now = time.time()
+        recent = await self.ledger.recent_warning_counts(now - horizon)
+        for key, (count, created_at) in recent.items():
+            self.user_warnings.restore(key, count, now - created_at)
+        print(f"✅ Restored warnings for {len(self.user_warnings.entries)} member(s) from the infraction ledger")
+
+    def guild_settings(self, guild_id):
+        """Per-guild moderation settings (served from the config store's cache)"""
+        store = getattr(self.bot, "guild_config", None)
+        if store is None:
+            return {
+                "spam_threshold": self.spam_threshold,
+                "spam_timeframe": self.spam_timeframe,
+                "moderation_enabled": True,
+            }
+        return store.get(guild_id)
+
+    def modlog_target(self, guild):
+        """(channel, temporary) for timeout notices, resolved once per guild until something changes"""
+        configured = self.guild_settings(guild.id).get("modlog_channel_id")
+        cached = self.modlog_targets.get(guild.id)
+        if cached is not None and cached[0] == configured:
+            channel = guild.get_channel(cached[1]) if cached[1] else None
+            if channel is not None or cached[1] is None:
+                self.modlog_stats["hits"] += 1
+                return channel, cached[2]
+
+        self.modlog_stats["misses"] += 1
+        channel, temporary = self._resolve_modlog(guild, configured)
+        self.modlog_targets[guild.id] = (configured, channel.id if channel else None, temporary)
+        return channel, temporary
+
+    def _resolve_modlog(self, guild, configured):
+        def writable(channel):
+            return channel is not None and channel.permissions_for(guild.me).send_messages
+
+        # The configured channel, then a channel named like a moderation log
+        candidates = [guild.get_channel(configured)] if configured else []
+        candidates.append(discord.utils.get(guild.text_channels, name="mod-logs"))
+        candidates.append(discord.utils.get(guild.text_channels, name="moderation"))
+        for channel in candidates:
+            if writable(channel):
+                return channel, False
+        # Otherwise the first channel the bot can write in; notices there are cleaned up
+        for channel in guild.text_channels:
+            if writable(channel):
+                return channel, True
+        return None, False
+
+    def invalidate_modlog(self, guild_id):
+        if self.modlog_targets.pop(guild_id, None) is not None:
+            self.modlog_stats["invalidations"] += 1
+
+    # Anything that can change which channel is (or can be) the mod log drops the cached target
+    @commands.Cog.listener()
+    async def on_guild_channel_create(self, channel):
+        self.invalidate_modlog(channel.guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel):
+        self.invalidate_modlog(channel.guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_update(self, before, after):
+        self.invalidate_modlog(after.guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_role_create(self, role):
+        self.invalidate_modlog(role.guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role):
+        self.invalidate_modlog(role.guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_role_update(self, before, after):
+        self.invalidate_modlog(after.guild.id)
+
+    @commands.Cog.listener()
+    async def on_member_update(self, before, after):
+        # The bot's own roles decide what it can write to
+        if after.id == self.bot.user.id and before.roles != after.roles:
+            self.invalidate_modlog(after.guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild):
+        self.modlog_targets.pop(guild.id, None)
+
     @commands.Cog.listener()
     async def on_message(self, message):
         # Ignore bot messages and DMs
         if message.author.bot or not message.guild:
             return
+
+        # Moderation can be switched off per guild with /config feature
+        if not self.guild_settings(message.guild.id)["moderation_enabled"]:
+            return
             
         # Ignore messages from admins/mods
         if message.author.guild_permissions.administrator or message.author.guild_permissions.manage_messages:
             return
         
+        # Remember the message ID so a spam burst can be deleted without fetching history
+        self.recent_messages.add((message.guild.id, message.channel.id, message.author.id), message.id)
+
         # Process all checks asynchronously without blocking
         # Using asyncio.ensure_future to prevent blocking the event loop
         asyncio.ensure_future(self.process_message_moderation(message))
@@ -72,53 +319,45 @@ class ModerationCog(commands.Cog):
 
     async def check_spam(self, message):
         """Check for message spam with proper locking"""
-        user_id = message.author.id
+        key = (message.guild.id, message.author.id)
+        lock = self.user_locks.get(key)
+        if lock is None:
+            lock = self.user_locks[key] = asyncio.Lock()
         
         # Use per-user lock to prevent race conditions
-        async with self.user_locks[user_id]:
+        async with lock:
             # Skip if user is already being processed for spam
-            if user_id in self.processing_users:
+            if key in self.processing_users:
                 return
                 
-            now = datetime.now()
-            
-            # Add message timestamp to user's message history
-            self.user_messages[user_id].append(now)
+            settings = self.guild_settings(message.guild.id)
             
             # Check if user sent too many messages in timeframe
-            recent_messages = [
-                msg_time for msg_time in self.user_messages[user_id]
-                if now - msg_time <= timedelta(seconds=self.spam_timeframe)
-            ]
-            
-            if len(recent_messages) >= self.spam_threshold:
+            if self.spam_tracker.hit(key, settings["spam_threshold"], settings["spam_timeframe"]):
                 # Mark user as being processed
-                self.processing_users.add(user_id)
+                self.processing_users.add(key)
                 try:
                     await self.handle_spam_violation(message)
                 finally:
                     # Always remove from processing set
-                    self.processing_users.discard(user_id)
+                    self.processing_users.discard(key)
 
     async def check_nsfw_content(self, message):
         """Check for NSFW content in messages"""
         content = message.content.lower()
         
-        # Check for NSFW keywords
-        for keyword in self.nsfw_keywords:
-            if keyword in content:
-                await self.handle_nsfw_violation(message, f"NSFW keyword: {keyword}")
-                return
-        
-        # Check for NSFW domains in URLs
-        url_pattern = re.compile(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+')
-        urls = url_pattern.findall(content)
+        # Check for NSFW keywords (single pass over the message)
+        keyword = self.keyword_matcher.search(content)
+        if keyword:
+            await self.handle_nsfw_violation(message, f"NSFW keyword: {keyword}")
+            return
         
-        for url in urls:
-            for domain in self.nsfw_domains:
-                if domain in url.lower():
-                    await self.handle_nsfw_violation(message, f"NSFW domain: {domain}")
-                    return
+        # Check each link's host (and its parent domains) against the blocklist
+        for host in url_hosts(content):
+            domain = self.domain_blocklist.match(host)
+            if domain:
+                await self.handle_nsfw_violation(message, f"NSFW domain: {domain}")
+                return
 
     async def check_invite_links(self, message):
         """Check for Discord invite links"""
@@ -131,39 +370,43 @@ class ModerationCog(commands.Cog):
             user_id = message.author.id
             channel = message.channel
             bot_id = self.bot.user.id
+            settings = self.guild_settings(message.guild.id)
+            self.delete_stats["incidents"] += 1
             
-            # First, collect all recent spam messages from this user to delete them all
-            # Only collect user messages, NOT bot messages
-            spam_messages = []
-            async for msg in channel.history(limit=50):
-                if (msg.author.id == user_id and 
-                    msg.author.id != bot_id and  # NEVER delete bot's own messages
-                    not msg.author.bot and  # NEVER delete any bot messages
-                    msg.id not in self.warning_messages and  # Don't delete warning messages
-                    not msg.pinned):  # Don't delete pinned messages
-                    spam_messages.append(msg)
-                    if len(spam_messages) >= 10:  # Limit to prevent excessive deletion
-                        break
+            # The burst was recorded as it arrived (only this member's own messages, never bot messages).
+            # If the buffer holds the whole timeframe, delete straight from the IDs with no history fetch.
+            buffer_key = (message.guild.id, channel.id, user_id)
+            timeframe = settings["spam_timeframe"]
+            if self.recent_messages.covers(buffer_key, timeframe):
+                message_ids = self.recent_messages.recent(buffer_key, timeframe)
+                spam_ids = [message_id for message_id in message_ids if message_id not in self.notices]
+                self.delete_stats["buffer_deletes"] += 1
+                self.delete_stats["rest_calls_saved"] += 1  # The channel.history page
+            else:
+                # Buffer incomplete (right after a restart, or it overflowed): find the messages in history
+                # Only collect user messages, NOT bot messages
+                spam_ids = []
+                self.delete_stats["history_fallbacks"] += 1
+                async for msg in channel.history(limit=50):
+                    if (msg.author.id == user_id and 
+                        msg.author.id != bot_id and  # NEVER delete bot's own messages
+                        not msg.author.bot and  # NEVER delete any bot messages
+                        msg.id not in self.notices and  # Don't delete warning messages
+                        not msg.pinned):  # Don't delete pinned messages
+                        spam_ids.append(msg.id)
+                        if len(spam_ids) >= self.recent_messages.size:  # Limit to prevent excessive deletion
+                            break
             
-            # Delete all spam messages at once
-            deleted_count = 0
-            if spam_messages:
-                try:
-                    await channel.delete_messages(spam_messages)
-                    deleted_count = len(spam_messages)
-                    print(f"🗑️ Deleted {deleted_count} spam messages from {message.author.name}")
-                except (discord.NotFound, discord.Forbidden, discord.HTTPException):
-                    # Fallback: delete messages individually
-                    for msg in spam_messages:
-                        try:
-                            await msg.delete()
-                            deleted_count += 1
-                        except (discord.NotFound, discord.Forbidden):
-                            pass
+            # Queue the deletes ahead of everything else; they merge into one bulk delete per channel
+            for message_id in spam_ids:
+                self.actions.delete(channel, message_id)
+            deleted_count = len(spam_ids)
+            if spam_ids:
+                print(f"🗑️ Deleting {deleted_count} spam messages from {message.author.name}")
+                self.recent_messages.discard(buffer_key, spam_ids)
             
-            # Add warning with thread safety
-            self.user_warnings[user_id] += 1
-            warnings = self.user_warnings[user_id]
+            # Add warning (older warnings decay over time)
+            warnings = self.user_warnings.add((message.guild.id, user_id))
             
             # Create warning embed
             embed = discord.Embed(
@@ -175,26 +418,25 @@ class ModerationCog(commands.Cog):
             embed.add_field(name="Action", value=f"Deleted {deleted_count} messages", inline=True)
             embed.add_field(name="Reason", value="Sending messages too quickly", inline=False)
             
-            # Send warning and protect it from deletion
-            try:
-                warning_msg = await channel.send(embed=embed)
-                self.warning_messages.add(warning_msg.id)  # Protect from deletion
-                
-                # Schedule warning deletion and cleanup
-                def cleanup_warning():
-                    asyncio.create_task(self._cleanup_warning_message(warning_msg))
-                
-                asyncio.get_event_loop().call_later(15, cleanup_warning)
-                
-            except (discord.Forbidden, discord.HTTPException):
-                pass  # Can't send message, continue with timeout
+            # Warning notice (queued behind deletes/timeouts, protected until it's cleaned up)
+            self.send_notice(channel, embed, 15, key=("spam", message.guild.id, user_id))
             
             # Take action based on warnings
             if warnings >= self.max_warnings:
                 # Reset warnings before timeout to prevent duplicate timeouts
-                self.user_warnings[user_id] = 0
-                # Schedule timeout without blocking
-                asyncio.create_task(self.timeout_user(message.author, message.guild, 600, "Excessive spam"))
+                self.user_warnings.reset((message.guild.id, user_id))
+                # The timeout gets its own ledger row once it's applied
+                self.record_infraction(
+                    message.guild.id, user_id, "spam", "Sending messages too quickly",
+                    f"Deleted {deleted_count} messages", warning_count=0
+                )
+                # Queue the timeout without blocking
+                self.queue_timeout(message.author, message.guild, 600, "Excessive spam")
+            else:
+                self.record_infraction(
+                    message.guild.id, user_id, "spam", "Sending messages too quickly",
+                    f"Deleted {deleted_count} messages", warning_count=warnings
+                )
                 
         except Exception as e:
             print(f"❌ Error handling spam violation: {e}")
@@ -202,11 +444,11 @@ class ModerationCog(commands.Cog):
     async def handle_nsfw_violation(self, message, reason):
         """Handle NSFW content violation"""
         try:
-            # Delete the message first
-            try:
-                await message.delete()
-            except (discord.NotFound, discord.Forbidden):
-                pass  # Message already deleted or no permission
+            # Delete the message first (queued at top priority; a message caught twice is deleted once)
+            self.actions.delete(message.channel, message.id)
+
+            # Timeout user for 30 minutes for NSFW content (queued, don't await); a longer pending timeout wins
+            duration = self.queue_timeout(message.author, message.guild, 1800, f"NSFW content: {reason}")
             
             # Create violation embed
             embed = discord.Embed(
@@ -215,24 +457,14 @@ class ModerationCog(commands.Cog):
                 color=discord.Color.red()
             )
             embed.add_field(name="Reason", value=reason, inline=False)
-            embed.add_field(name="Action", value="Message deleted + 30min timeout", inline=True)
+            action = "Message deleted" if duration is None else f"Message deleted + {duration // 60}min timeout"
+            embed.add_field(name="Action", value=action, inline=True)
             
-            # Send warning and protect it from deletion
-            try:
-                warning_msg = await message.channel.send(embed=embed)
-                self.warning_messages.add(warning_msg.id)  # Protect from deletion
-                
-                # Schedule warning deletion and cleanup
-                def cleanup_warning():
-                    asyncio.create_task(self._cleanup_warning_message(warning_msg))
-                
-                asyncio.get_event_loop().call_later(20, cleanup_warning)
-                
-            except (discord.Forbidden, discord.HTTPException):
-                pass  # Can't send message, continue with timeout
+            # Warning notice (queued behind deletes/timeouts, protected until it's cleaned up)
+            self.send_notice(message.channel, embed, 20, key=("nsfw", message.guild.id, message.author.id))
             
-            # Timeout user for 30 minutes for NSFW content (don't await)
-            asyncio.create_task(self.timeout_user(message.author, message.guild, 1800, f"NSFW content: {reason}"))
+            # The timeout gets its own ledger row once it's applied
+            self.record_infraction(message.guild.id, message.author.id, "nsfw", reason, "Message deleted")
                 
         except Exception as e:
             print(f"❌ Error handling NSFW violation: {e}")
@@ -240,16 +472,12 @@ class ModerationCog(commands.Cog):
     async def handle_invite_violation(self, message):
         """Handle Discord invite link violation"""
         try:
-            # Delete the message first
-            try:
-                await message.delete()
-            except (discord.NotFound, discord.Forbidden):
-                pass  # Message already deleted or no permission
+            # Delete the message first (queued at top priority; a message caught twice is deleted once)
+            self.actions.delete(message.channel, message.id)
             
-            # Add warning with thread safety
+            # Add warning (older warnings decay over time)
             user_id = message.author.id
-            self.user_warnings[user_id] += 1
-            warnings = self.user_warnings[user_id]
+            warnings = self.user_warnings.add((message.guild.id, user_id))
             
             # Create violation embed
             embed = discord.Embed(
@@ -260,86 +488,111 @@ class ModerationCog(commands.Cog):
             embed.add_field(name="Warning", value=f"{warnings}/{self.max_warnings}", inline=True)
             embed.add_field(name="Action", value="Message deleted", inline=True)
             
-            # Send warning and protect it from deletion
-            try:
-                warning_msg = await message.channel.send(embed=embed)
-                self.warning_messages.add(warning_msg.id)  # Protect from deletion
-                
-                # Schedule warning deletion and cleanup
-                def cleanup_warning():
-                    asyncio.create_task(self._cleanup_warning_message(warning_msg))
-                
-                asyncio.get_event_loop().call_later(15, cleanup_warning)
-                
-            except (discord.Forbidden, discord.HTTPException):
-                pass  # Can't send message, continue
+            # Warning notice (queued behind deletes/timeouts, protected until it's cleaned up)
+            self.send_notice(message.channel, embed, 15, key=("invite", message.guild.id, user_id))
             
             # Take action based on warnings
             if warnings >= self.max_warnings:
                 # Reset warnings before timeout to prevent duplicates
-                self.user_warnings[user_id] = 0
-                # Schedule timeout without blocking
-                asyncio.create_task(self.timeout_user(message.author, message.guild, 3600, "Excessive invite link spam"))
+                self.user_warnings.reset((message.guild.id, user_id))
+                # The timeout gets its own ledger row once it's applied
+                self.record_infraction(
+                    message.guild.id, user_id, "invite", "Discord invite link",
+                    "Message deleted", warning_count=0
+                )
+                # Queue the timeout without blocking
+                self.queue_timeout(message.author, message.guild, 3600, "Excessive invite link spam")
+            else:
+                self.record_infraction(
+                    message.guild.id, user_id, "invite", "Discord invite link",
+                    "Message deleted", warning_count=warnings
+                )
                 
         except Exception as e:
             print(f"❌ Error handling invite violation: {e}")
 
-    async def safe_delete_message(self, message):
-        """Safely delete a message without causing errors"""
-        try:
-            await message.delete()
-        except (discord.NotFound, discord.Forbidden, discord.HTTPException):
-            # Message already deleted or no permissions
-            pass
+    def send_notice(self, channel, embed, delete_after, key=None):
+        """Queue a notice; a newer notice with the same key replaces one that hasn't been sent yet"""
+        async def send():
+            try:
+                return await channel.send(embed=embed)
+            except (discord.Forbidden, discord.HTTPException):
+                return None  # Can't send message, the action itself still happened
 
-    async def _cleanup_warning_message(self, warning_msg):
-        """Clean up warning message and remove from protection list"""
-        try:
-            # Remove from protected messages
-            self.warning_messages.discard(warning_msg.id)
-            # Delete the warning message
-            await warning_msg.delete()
-        except (discord.NotFound, discord.Forbidden, discord.HTTPException):
-            # Message already deleted or no permissions
-            pass
+        def sent(future):
+            warning_msg = None if future.cancelled() else future.result()
+            if warning_msg is not None:
+                # Protected from deletion until its scheduled cleanup
+                self.notices.schedule(warning_msg.channel.id, warning_msg.id, delete_after)
+
+        return self.actions.run(NOTICE, send, key=key, on_done=sent)
+
+    def queue_timeout(self, member, guild, duration, reason):
+        """
+        Queue a timeout. While one is still pending for the member only the
+        longer of the two runs; returns the duration that will be applied
+        (None if the action queue is full and no timeout will happen).
+        """
+        key = ("timeout", guild.id, member.id)
+        future = self.actions.run(
+            TIMEOUT,
+            lambda: self.timeout_user(member, guild, duration, reason),
+            key=key,
+            rank=duration,
+        )
+        if future.cancelled():
+            return None  # Dropped by the full action queue
+        return self.actions.pending_rank(key) or duration
 
     async def timeout_user(self, member, guild, duration, reason):
-        """Timeout a user (non-blocking)"""
+        """Timeout a user; the notification is queued behind other moderation actions"""
         try:
             # Calculate timeout duration (Discord.py 2.0+ uses timedelta directly)
             timeout_until = discord.utils.utcnow() + timedelta(seconds=duration)
-            await member.edit(timed_out_until=timeout_until, reason=reason)
-            
-            # Send timeout notification without blocking
-            embed = discord.Embed(
-                title="⏰ User Timed Out",
-                description=f"{member.mention} has been timed out",
-                color=discord.Color.dark_red()
+            # `member` is the message's snapshot; check the cached member and what we applied ourselves
+            key = (guild.id, member.id)
+            live = guild.get_member(member.id) or member
+            current = max(
+                (until for until in (live.timed_out_until, self.timed_out_until.get(key)) if until),
+                default=None,
             )
-            embed.add_field(name="Duration", value=f"{duration // 60} minutes", inline=True)
-            embed.add_field(name="Reason", value=reason, inline=True)
-            
-            # Try to find a moderation log channel (non-blocking)
-            try:
-                mod_channel = discord.utils.get(guild.channels, name="mod-logs") or discord.utils.get(guild.channels, name="moderation")
-                if mod_channel and mod_channel.permissions_for(guild.me).send_messages:
-                    await mod_channel.send(embed=embed)
-                else:
-                    # Send notification to the first available channel
-                    for channel in guild.text_channels:
-                        if channel.permissions_for(guild.me).send_messages:
-                            timeout_msg = await channel.send(embed=embed)
-                            # Schedule deletion without blocking
-                            asyncio.get_event_loop().call_later(30, 
-                                lambda: asyncio.create_task(self.safe_delete_message(timeout_msg)))
-                            break
-            except (discord.Forbidden, discord.HTTPException):
-                pass  # Can't send notification, timeout was still applied
-                        
+            if current and current >= timeout_until:
+                return  # Already timed out for longer, don't shorten it
+            await member.edit(timed_out_until=timeout_until, reason=reason)
+            self.timed_out_until[key] = timeout_until
+            self.record_infraction(guild.id, member.id, "timeout", reason, f"{duration // 60}min timeout")
         except discord.Forbidden:
             print(f"❌ Missing permissions to timeout users in {guild.name}")
+            return
         except Exception as e:
             print(f"❌ Error timing out user {member.name}: {e}")
+            return
+
+        # Send timeout notification without blocking
+        embed = discord.Embed(
+            title="⏰ User Timed Out",
+            description=f"{member.mention} has been timed out",
+            color=discord.Color.dark_red()
+        )
+        embed.add_field(name="Duration", value=f"{duration // 60} minutes", inline=True)
+        embed.add_field(name="Reason", value=reason, inline=True)
+        self.actions.run(NOTICE, lambda: self.send_timeout_notice(guild, embed))
+
+    async def send_timeout_notice(self, guild, embed):
+        """Post a timeout notification to the mod log, or briefly to the first writable channel"""
+        channel, temporary = self.modlog_target(guild)
+        if channel is None:
+            return  # Nowhere to send it, timeout was still applied
+        try:
+            timeout_msg = await channel.send(embed=embed)
+        except discord.Forbidden:
+            self.invalidate_modlog(guild.id)  # Lost access without an event we watch; resolve again next time
+            return
+        except discord.HTTPException:
+            return  # Can't send notification, timeout was still applied
+        if temporary:
+            # Schedule deletion without blocking
+            self.notices.schedule(channel.id, timeout_msg.id, 30)
 
     # Slash commands for moderation
     @app_commands.command(name="clear", description="Clear messages from the channel")
@@ -378,12 +631,49 @@ class ModerationCog(commands.Cog):
             # Use the improved timeout function
             timeout_until = discord.utils.utcnow() + timedelta(minutes=duration)
             await member.edit(timed_out_until=timeout_until, reason=reason)
+            # A moderator's timeout is the one in force, even if it's shorter than an automatic one
+            self.timed_out_until[(interaction.guild.id, member.id)] = timeout_until
+            self.record_infraction(
+                interaction.guild.id, member.id, "manual", reason,
+                f"{duration}min timeout by {interaction.user}"
+            )
             await interaction.response.send_message(f"✅ {member.mention} has been timed out for {duration} minutes.\nReason: {reason}", ephemeral=True)
         except discord.Forbidden:
             await interaction.response.send_message("❌ I don't have permission to timeout users.", ephemeral=True)
         except Exception as e:
             await interaction.response.send_message(f"❌ Error timing out user: {str(e)}", ephemeral=True)
 
+    @app_commands.command(name="warnings", description="Show a member's warnings and infraction history")
+    @app_commands.describe(member="The member to look up")
+    async def warnings_command(self, interaction: discord.Interaction, member: discord.Member):
+        if not interaction.user.guild_permissions.moderate_members:
+            await interaction.response.send_message("❌ You need 'Moderate Members' permission to use this command.", ephemeral=True)
+            return
+
+        if self.ledger is None:
+            await interaction.response.send_message("❌ The infraction ledger is not available.", ephemeral=True)
+            return
+
+        await interaction.response.defer(ephemeral=True)
+        rows, total = await self.ledger.history(interaction.guild.id, member.id)
+        warnings = self.user_warnings.get((interaction.guild.id, member.id))
+
+        embed = discord.Embed(
+            title=f"📋 Infractions for {member.display_name}",
+            color=discord.Color.orange() if total else discord.Color.green()
+        )
+        embed.add_field(name="Active Warnings", value=f"{warnings}/{self.max_warnings}", inline=True)
+        embed.add_field(name="Total Infractions", value=str(total), inline=True)
+        embed.add_field(
+            name=f"🕒 Latest {len(rows)}" if rows else "🕒 History",
+            value="\n".join(
+                f"<t:{int(created_at)}:R> • **{kind}** — {action} ({reason})"
+                for kind, reason, action, _, created_at in rows
+            )[:1024] if rows else "No infractions recorded",
+            inline=False
+        )
+        await interaction.followup.send(embed=embed, ephemeral=True)
+
     @app_commands.command(name="modconfig", description="Configure moderation settings")
     @app_commands.describe(
         spam_threshold="Number of messages before spam detection (default: 5)",
@@ -394,17 +684,27 @@ class ModerationCog(commands.Cog):
             await interaction.response.send_message("❌ You need administrator permissions to configure moderation.", ephemeral=True)
             return
         
+        store = getattr(self.bot, "guild_config", None)
         if spam_threshold:
-            self.spam_threshold = max(3, min(20, spam_threshold))
+            spam_threshold = max(3, min(20, spam_threshold))
+            if store is not None:
+                store.set(interaction.guild.id, "spam_threshold", spam_threshold)
+            else:
+                self.spam_threshold = spam_threshold
         if spam_timeframe:
-            self.spam_timeframe = max(5, min(60, spam_timeframe))
+            spam_timeframe = max(5, min(60, spam_timeframe))
+            if store is not None:
+                store.set(interaction.guild.id, "spam_timeframe", spam_timeframe)
+            else:
+                self.spam_timeframe = spam_timeframe
         
+        settings = self.guild_settings(interaction.guild.id)
         embed = discord.Embed(
             title="🔧 Moderation Configuration",
             color=discord.Color.blue()
         )
-        embed.add_field(name="Spam Threshold", value=f"{self.spam_threshold} messages", inline=True)
-        embed.add_field(name="Spam Timeframe", value=f"{self.spam_timeframe} seconds", inline=True)
+        embed.add_field(name="Spam Threshold", value=f"{settings['spam_threshold']} messages", inline=True)
+        embed.add_field(name="Spam Timeframe", value=f"{settings['spam_timeframe']} seconds", inline=True)
         embed.add_field(name="Max Warnings", value=f"{self.max_warnings}", inline=True)
         
         await interaction.response.send_message(embed=embed, ephemeral=True)
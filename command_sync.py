@@ -0,0 +1,91 @@
+"""
+Skip redundant slash-command syncs.
+
+A fingerprint of the serialized command tree is stored per scope (global and
+each guild). Syncing only happens for scopes whose fingerprint changed since
+the last successful sync, so gateway reconnects don't trigger N+1 sync calls.
+"""
+import hashlib
+import json
+import os
+
+
+def tree_fingerprint(tree, guild=None):
+    """Stable hash of the commands registered for a scope (None = global)"""
+    payload = []
+    for command in tree.get_commands(guild=guild):
+        try:
+            payload.append(command.to_dict(tree))
+        except TypeError:
+            payload.append(command.to_dict())  # discord.py < 2.4
+    payload.sort(key=lambda c: (c.get("type", 1), c["name"]))
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+class CommandSyncState:
+    """Last synced fingerprint per scope, persisted as a small JSON file"""
+
+    def __init__(self, path):
+        self.path = path
+        self.fingerprints = {}  # "global" or str(guild_id) -> fingerprint
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self.fingerprints = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"⚠️  Could not read command sync state {path}: {e}")
+
+    def save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.fingerprints, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"⚠️  Could not write command sync state {self.path}: {e}")
+
+    def needs_sync(self, scope, fingerprint):
+        return self.fingerprints.get(scope) != fingerprint
+
+    def mark_synced(self, scope, fingerprint):
+        self.fingerprints[scope] = fingerprint
+
+
+async def sync_command_tree(tree, guilds, state, force=False, include_global=True):
+    """
+    Copy global commands into each guild and sync only the scopes that changed.
+
+    Returns (synced, skipped): lists of scope labels that were synced or avoided.
+    """
+    synced = []
+    skipped = []
+
+    try:
+        for guild in guilds:
+            tree.copy_global_to(guild=guild)
+            scope = str(guild.id)
+            fingerprint = tree_fingerprint(tree, guild=guild)
+            if not force and not state.needs_sync(scope, fingerprint):
+                skipped.append(guild.name)
+                continue
+            commands = await tree.sync(guild=guild)
+            state.mark_synced(scope, fingerprint)
+            synced.append(guild.name)
+            print(f"✅ Synced {len(commands)} command(s) to guild: {guild.name}")
+
+        if include_global:
+            fingerprint = tree_fingerprint(tree)
+            if force or state.needs_sync("global", fingerprint):
+                commands = await tree.sync()
+                state.mark_synced("global", fingerprint)
+                synced.append("global")
+                print(f"✅ Synced {len(commands)} global slash command(s)")
+            else:
+                skipped.append("global")
+    finally:
+        # Keep whatever succeeded even if a later sync call failed
+        if synced:
+            state.save()
+    return synced, skipped
@@ -0,0 +1,190 @@
+"""
+Compiled matchers for the moderation content filters.
+
+KeywordMatcher folds every keyword into one trie-shaped regular expression, so
+a message is scanned once no matter how many terms are loaded: shared prefixes
+become a single branch and the regex engine never retries the whole list at
+each position. Terms can be matched as whole words (no "class" -> "ass" hits)
+and text can be normalized for common leetspeak substitutions first.
+
+Keyword files hold one term per line; blank lines and `#` comments are
+ignored. A trailing `*` lets a term match as a prefix of a longer word
+(`fuck*` also catches "fucking"), which only matters in whole-word mode.
+
+DomainBlocklist stores blocked domains as a sorted array of 64-bit hashes
+(8 bytes per domain, so 100k+ entries stay under a megabyte) and checks a URL
+host by walking its suffixes: `sub.example.com` is looked up as
+`sub.example.com`, `example.com` and `com`, which costs O(labels) lookups
+however long the list is.
+"""
+import hashlib
+import re
+from array import array
+from bisect import bisect_left
+
+# Common character substitutions folded back to letters in leetspeak mode
+LEET_TABLE = str.maketrans({
+    "0": "o", "1": "i", "3": "e", "4": "a", "5": "s", "7": "t",
+    "@": "a", "$": "s",
+})
+
+_PREFIX = "*"  # Trie key for "any word characters may follow"
+_END = ""  # Trie key for "a term ends here"
+
+
+def load_terms(path):
+    """Terms from a keyword file (one per line, `#` comments, lowercased)"""
+    terms = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            term = line.split("#", 1)[0].strip().lower()
+            if term:
+                terms.append(term)
+    return terms
+
+
+def _trie_pattern(node):
+    """Regex for a trie node: alternatives are merged by shared prefix"""
+    optional = _END in node
+    branches = []
+    chars = []
+    for key in sorted(k for k in node if k not in (_END, _PREFIX)):
+        sub = _trie_pattern(node[key])
+        if sub:
+            branches.append(re.escape(key) + sub)
+        else:
+            chars.append(re.escape(key))
+    if _PREFIX in node:
+        branches.append(r"\w*")
+
+    if chars:
+        branches.append(chars[0] if len(chars) == 1 else f"[{''.join(chars)}]")
+    if not branches:
+        return ""
+    pattern = branches[0] if len(branches) == 1 and not optional else f"(?:{'|'.join(branches)})"
+    return pattern + "?" if optional else pattern
+
+
+class KeywordMatcher:
+    """
+    Single-pass matcher for a keyword list.
+
+    `search(text)` returns the matched text (lowercased, normalized) or None.
+    """
+
+    def __init__(self, terms, word_boundary=True, leetspeak=False):
+        self.word_boundary = word_boundary
+        self.leetspeak = leetspeak
+
+        trie = {}
+        count = 0
+        for term in terms:
+            term = term.strip().lower()
+            prefix = term.endswith(_PREFIX)
+            term = term.rstrip(_PREFIX)
+            if leetspeak:
+                term = term.translate(LEET_TABLE)
+            if not term:
+                continue
+            node = trie
+            for char in term:
+                node = node.setdefault(char, {})
+            node[_PREFIX if prefix else _END] = {}
+            count += 1
+        self.size = count
+
+        body = _trie_pattern(trie)
+        if not body:
+            self.pattern = None
+        elif word_boundary:
+            self.pattern = re.compile(rf"(?<!\w)(?:{body})(?!\w)")
+        else:
+            self.pattern = re.compile(body)
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        return cls(load_terms(path), **kwargs)
+
+    def __len__(self):
+        return self.size
+
+    def normalize(self, text):
+        text = text.lower()
+        return text.translate(LEET_TABLE) if self.leetspeak else text
+
+    def search(self, text):
+        if self.pattern is None:
+            return None
+        match = self.pattern.search(self.normalize(text))
+        return match.group() if match else None
+
+
+# Host part of http(s) links; stops at the path and at Markdown/quoting characters
+URL_HOST_PATTERN = re.compile(r"https?://([^\s/?#<>()\[\]{}\"'`*|~\\]+)", re.IGNORECASE)
+
+
+def url_hosts(text):
+    """Lowercased hosts of every http(s) link in the text (userinfo and port removed)"""
+    hosts = []
+    for authority in URL_HOST_PATTERN.findall(text):
+        host = authority.rpartition("@")[2].partition(":")[0].strip(".").lower()
+        if host:
+            hosts.append(host)
+    return hosts
+
+
+def domain_hash(domain):
+    return int.from_bytes(hashlib.blake2b(domain.encode(), digest_size=8).digest(), "little")
+
+
+def load_domains(path):
+    """Domains from a blocklist file: one per line, or hosts-file style ("0.0.0.0 example.com")"""
+    domains = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            fields = line.split("#", 1)[0].split()
+            if fields:
+                domains.append(fields[-1])
+    return domains
+
+
+class DomainBlocklist:
+    """Compact hashed set of blocked domains with suffix matching"""
+
+    def __init__(self, domains=()):
+        hashes = set()
+        for domain in domains:
+            domain = domain.strip().lower().removeprefix("*.").strip(".")
+            if domain:
+                hashes.add(domain_hash(domain))
+        self.hashes = array("Q", sorted(hashes))
+
+    @classmethod
+    def from_file(cls, path, extra=()):
+        return cls([*extra, *load_domains(path)])
+
+    def __len__(self):
+        return len(self.hashes)
+
+    @property
+    def nbytes(self):
+        return self.hashes.itemsize * len(self.hashes)
+
+    def __contains__(self, domain):
+        key = domain_hash(domain)
+        index = bisect_left(self.hashes, key)
+        return index < len(self.hashes) and self.hashes[index] == key
+
+    def match(self, host):
+        """The blocked domain `host` falls under (itself or a parent), or None"""
+        if not self.hashes:
+            return None
+        start = 0
+        while True:
+            suffix = host[start:]
+            if suffix in self:
+                return suffix
+            dot = host.find(".", start)
+            if dot < 0:
+                return None
+            start = dot + 1
@@ -0,0 +1,104 @@
+"""
+Per-guild configuration backed by SQLite with an in-memory read-through cache.
+
+Reads on the hot path (joins, every moderated message) are served from the
+cache; only a cache miss or a write touches the database, and writes drop the
+guild's cached entry so the next read picks up the new value.
+"""
+import json
+import os
+import sqlite3
+import threading
+
+# Settings every guild has, with the value used until an admin changes it
+DEFAULTS = {
+    "welcome_channel_id": None,
+    "leaving_channel_id": None,
+    "modlog_channel_id": None,
+    "spam_threshold": 5,
+    "spam_timeframe": 10,
+    "template": "OG_Welcome",
+    "welcome_enabled": True,
+    "leave_enabled": True,
+    "stats_enabled": True,
+    "moderation_enabled": True,
+}
+
+
+class GuildConfigStore:
+    def __init__(self, path, defaults=None):
+        self.path = path
+        self.defaults = dict(DEFAULTS if defaults is None else defaults)
+        self.cache = {}  # guild_id -> merged settings dict
+        self.stats = {"hits": 0, "misses": 0, "writes": 0}
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db_lock = threading.Lock()
+        with self.db_lock, self.db:
+            self.db.execute(
+                """CREATE TABLE IF NOT EXISTS guild_config (
+                    guild_id INTEGER NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    PRIMARY KEY (guild_id, key)
+                )"""
+            )
+
+    def _load(self, guild_id):
+        with self.db_lock:
+            rows = self.db.execute(
+                "SELECT key, value FROM guild_config WHERE guild_id = ?", (guild_id,)
+            ).fetchall()
+        settings = dict(self.defaults)
+        for key, value in rows:
+            if key in self.defaults:
+                settings[key] = json.loads(value)
+        return settings
+
+    def warm(self):
+        """Load every stored guild into the cache in one query (call at startup)"""
+        with self.db_lock:
+            rows = self.db.execute("SELECT guild_id, key, value FROM guild_config").fetchall()
+        for guild_id, key, value in rows:
+            settings = self.cache.setdefault(guild_id, dict(self.defaults))
+            if key in self.defaults:
+                settings[key] = json.loads(value)
+        return len(self.cache)
+
+    def get(self, guild_id):
+        """All settings for a guild (treat the returned dict as read-only)"""
+        settings = self.cache.get(guild_id)
+        if settings is not None:
+            self.stats["hits"] += 1
+            return settings
+        self.stats["misses"] += 1
+        settings = self.cache[guild_id] = self._load(guild_id)
+        return settings
+
+    def set(self, guild_id, key, value):
+        if key not in self.defaults:
+            raise KeyError(f"Unknown guild setting: {key}")
+        with self.db_lock, self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO guild_config (guild_id, key, value) VALUES (?, ?, ?)",
+                (guild_id, key, json.dumps(value)),
+            )
+        self.stats["writes"] += 1
+        self.cache.pop(guild_id, None)
+
+    def reset(self, guild_id, key=None):
+        """Drop one (or every) override so the default applies again"""
+        with self.db_lock, self.db:
+            if key is None:
+                self.db.execute("DELETE FROM guild_config WHERE guild_id = ?", (guild_id,))
+            else:
+                self.db.execute(
+                    "DELETE FROM guild_config WHERE guild_id = ? AND key = ?", (guild_id, key)
+                )
+        self.stats["writes"] += 1
+        self.cache.pop(guild_id, None)
+
+    def close(self):
+        with self.db_lock:
+            self.db.close()
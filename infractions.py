@@ -0,0 +1,199 @@
+"""
+Durable infraction ledger for the moderation cog.
+
+Every warning, deletion and timeout is recorded in SQLite (WAL mode) so
+warning counts and history survive restarts. Recording never touches disk on
+the caller's path: rows go into an asyncio queue and a single writer inserts
+them in batches on a worker thread, one transaction per batch.
+"""
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+
+
+class InfractionLedger:
+    def __init__(self, path, batch_size=100, flush_interval=1.0, max_pending=10000):
+        self.path = path
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.queue = asyncio.Queue(maxsize=max_pending)
+        self.collecting = []  # Rows taken off the queue for the batch being gathered
+        self.writing = None  # The batch being written on the worker thread
+        self.worker = None
+
+        self.stats = {
+            "recorded": 0,
+            "written": 0,
+            "batches": 0,
+            "dropped": 0,
+            "failed": 0,
+        }
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db_lock = threading.Lock()
+        with self.db_lock, self.db:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")  # Safe with WAL; no fsync per commit
+            self.db.execute(
+                """CREATE TABLE IF NOT EXISTS infractions (
+                    id INTEGER PRIMARY KEY,
+                    guild_id INTEGER NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    type TEXT NOT NULL,
+                    reason TEXT NOT NULL,
+                    action TEXT NOT NULL,
+                    warning_count INTEGER,
+                    created_at REAL NOT NULL
+                )"""
+            )
+            # /warnings looks up one member's history, newest first
+            self.db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_infractions_member "
+                "ON infractions (guild_id, user_id, created_at)"
+            )
+            # Startup loads only recently active users
+            self.db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_infractions_created ON infractions (created_at)"
+            )
+
+    def start(self):
+        if self.worker is None or self.worker.done():
+            self.worker = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Stop the writer, write whatever is still queued and close the database"""
+        if self.worker is not None:
+            self.worker.cancel()
+            try:
+                await self.worker
+            except asyncio.CancelledError:
+                pass
+            self.worker = None
+        if self.writing is not None:
+            # Cancelling the writer doesn't stop its thread; let that batch land before closing
+            await self.writing
+            self.writing = None
+        rows = self.collecting
+        self.collecting = []
+        while not self.queue.empty():
+            rows.append(self.queue.get_nowait())
+        if rows:
+            self._write(rows)
+        with self.db_lock:
+            self.db.close()
+
+    def record(self, guild_id, user_id, kind, reason, action, warning_count=None):
+        """
+        Queue an infraction without waiting for disk.
+
+        `warning_count` is the member's warning count after this infraction
+        (None if it didn't change it); the latest one is restored at startup.
+        Returns False if the queue is full and the row was dropped.
+        """
+        row = (guild_id, user_id, kind, reason, action, warning_count, time.time())
+        try:
+            self.queue.put_nowait(row)
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+            print(f"⚠️  Infraction queue full, dropped {kind} record for user {user_id}")
+            return False
+        self.stats["recorded"] += 1
+        return True
+
+    async def _collect(self):
+        """Wait for the first row, then gather up to a batch within the flush interval"""
+        batch = self.collecting = [await self.queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            # Not wait_for: on Python 3.11 it swallows close()'s cancel if a row arrives at the same time
+            getter = asyncio.ensure_future(self.queue.get())
+            try:
+                await asyncio.wait({getter}, timeout=remaining)
+            finally:
+                timed_out = not getter.done()
+                if timed_out:
+                    getter.cancel()  # A row that arrives now stays queued
+                else:
+                    batch.append(getter.result())  # Kept in self.collecting if we're being cancelled
+            if timed_out:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            self.collecting = []
+            self.writing = asyncio.create_task(asyncio.to_thread(self._write, batch))
+            try:
+                # Shielded: a cancelled writer must not drop a batch that's already off the queue
+                await asyncio.shield(self.writing)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def _write(self, rows):
+        try:
+            with self.db_lock, self.db:
+                self.db.executemany(
+                    "INSERT INTO infractions (guild_id, user_id, type, reason, action, warning_count, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+        except sqlite3.Error as e:
+            self.stats["failed"] += len(rows)
+            print(f"❌ Error writing {len(rows)} infraction(s): {e}")
+            return
+        self.stats["written"] += len(rows)
+        self.stats["batches"] += 1
+
+    async def flush(self, timeout=2.0):
+        """Wait (briefly) until everything queued so far is on disk"""
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def _query(self, sql, params):
+        with self.db_lock:
+            return self.db.execute(sql, params).fetchall()
+
+    async def history(self, guild_id, user_id, limit=10):
+        """(latest infractions newest first, total count) for one member"""
+        await self.flush()
+        rows = await asyncio.to_thread(
+            self._query,
+            "SELECT type, reason, action, warning_count, created_at FROM infractions "
+            "WHERE guild_id = ? AND user_id = ? ORDER BY created_at DESC LIMIT ?",
+            (guild_id, user_id, limit),
+        )
+        total = await asyncio.to_thread(
+            self._query,
+            "SELECT COUNT(*) FROM infractions WHERE guild_id = ? AND user_id = ?",
+            (guild_id, user_id),
+        )
+        return rows, total[0][0]
+
+    async def recent_warning_counts(self, since):
+        """{(guild_id, user_id): (warning_count, created_at)} from each member's latest count since `since`"""
+        rows = await asyncio.to_thread(
+            self._query,
+            "SELECT guild_id, user_id, warning_count, created_at FROM infractions "
+            "WHERE created_at >= ? AND warning_count IS NOT NULL ORDER BY created_at, id",
+            (since,),
+        )
+        return {(guild_id, user_id): (count, created_at) for guild_id, user_id, count, created_at in rows}
+
+    def status(self):
+        return {
+            "depth": self.queue.qsize(),
+            "max_pending": self.queue.maxsize,
+            "avg_batch": self.stats["written"] / self.stats["batches"] if self.stats["batches"] else 0.0,
+            **self.stats,
+        }
@@ -1,11 +1,16 @@
-from flask import Flask
 from threading import Thread
 
-app = Flask('')
+def run():
+    # Flask is imported on the server thread so it never delays the bot's startup
+    from flask import Flask
 
-@app.route('/')
-def home():
-    return "Bot is running!"
+    app = Flask('')
+
+    @app.route('/')
+    def home():
+        return "Bot is running!"
+
+    app.run(host='0.0.0.0', port=8080)
 
 def keep_alive():
-    Thread(target=lambda: app.run(host='0.0.0.0', port=8080)).start()
+    Thread(target=run).start()
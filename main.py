@@ -1,19 +1,30 @@
 import discord
 from discord.ext import commands, tasks
-from PIL import Image, ImageDraw, ImageFont
-from io import BytesIO
-import requests
 import os
 from dotenv import load_dotenv
 from keep_alive import keep_alive
+from welcome_card import CardCache, CardLayout, WelcomeRenderer, RenderQueueFull, card_filename, ENCODINGS
+from avatar_cache import AvatarCache
+from welcome_queue import WelcomeQueue
+from server_stats import MemberCounter, StatsChannelStore, StatsScheduler, count_members, slot_delay
+from member_cache import POLICIES, cache_options, cache_report, process_rss
+from guild_config import GuildConfigStore
+from infractions import InfractionLedger
+from command_sync import CommandSyncState, sync_command_tree
 import asyncio
+import time
 
 # ------------------------ LOAD ENV ------------------------
 load_dotenv()
 
 TOKEN = os.getenv("DISCORD_BOT_TOKEN")
-WELCOME_CHANNEL_ID = int(os.getenv("WELCOME_CHANNEL_ID"))
-LEAVING_CHANNEL_ID = int(os.getenv("LEAVING_CHANNEL_ID"))
+# Legacy single-guild channels; per-guild values set with /config take precedence
+WELCOME_CHANNEL_ID = int(os.getenv("WELCOME_CHANNEL_ID") or 0)
+LEAVING_CHANNEL_ID = int(os.getenv("LEAVING_CHANNEL_ID") or 0)
+
+GUILD_CONFIG_DB = os.getenv("GUILD_CONFIG_DB", "./data/guild_config.db")
+COMMAND_SYNC_STATE = os.getenv("COMMAND_SYNC_STATE", "./data/command_sync.json")
+INFRACTIONS_DB = os.getenv("INFRACTIONS_DB", "./data/infractions.db")
 
 BACKGROUND_PATH = "./assets/OG_Welcome.png"
 FONT_PATH = "./assets/arial.ttf"
@@ -26,108 +37,273 @@ TEXT_POSITION = (130, 270)
 TEXT_FONT_SIZE = 38
 TEXT_COLOR = "white"
 
+# Welcome card output: "png", "png-quantized" or "webp" (see benchmark_welcome.py)
+CARD_ENCODING = os.getenv("WELCOME_CARD_ENCODING", "png")
+CARD_QUALITY = int(os.getenv("WELCOME_CARD_QUALITY", "80"))
+CARD_PNG_COMPRESS_LEVEL = int(os.getenv("WELCOME_CARD_PNG_COMPRESS_LEVEL", "6"))
+CARD_TARGET_WIDTH = int(os.getenv("WELCOME_CARD_WIDTH", "0"))
+CARD_MAX_BYTES = int(os.getenv("WELCOME_CARD_MAX_BYTES", "0"))
+if CARD_ENCODING not in ENCODINGS:
+    print(f"⚠️  Unknown WELCOME_CARD_ENCODING '{CARD_ENCODING}', using png")
+    CARD_ENCODING = "png"
+
+# Welcome card worker pool (PIL work never runs on the event loop)
+WELCOME_RENDER_WORKERS = int(os.getenv("WELCOME_RENDER_WORKERS", "2"))
+WELCOME_RENDER_MAX_PENDING = int(os.getenv("WELCOME_RENDER_MAX_PENDING", "16"))
+WELCOME_RENDER_TIMEOUT = float(os.getenv("WELCOME_RENDER_TIMEOUT", "10"))
+WELCOME_RENDER_PROCESSES = os.getenv("WELCOME_RENDER_PROCESSES", "0") == "1"
+
+# Resized avatar cache (memory LRU in front of a disk tier with TTL)
+AVATAR_CACHE_DIR = os.getenv("AVATAR_CACHE_DIR", "./cache/avatars")
+AVATAR_CACHE_ITEMS = int(os.getenv("AVATAR_CACHE_ITEMS", "256"))
+AVATAR_CACHE_TTL = int(os.getenv("AVATAR_CACHE_TTL", str(7 * 24 * 3600)))
+
+# Byte budget for memoized finished welcome cards
+CARD_CACHE_BYTES = int(os.getenv("CARD_CACHE_BYTES", str(32 * 1024 * 1024)))
+
+# Joins within this many seconds of each other are welcomed in one message
+WELCOME_COALESCE_WINDOW = float(os.getenv("WELCOME_COALESCE_WINDOW", "2"))
+WELCOME_BATCH_SIZE = int(os.getenv("WELCOME_BATCH_SIZE", "20"))
+WELCOME_QUEUE_SIZE = int(os.getenv("WELCOME_QUEUE_SIZE", "1000"))
+
+# Member cache: "full" (chunk everything at startup), "lazy" (chunk stats guilds on demand)
+# or "counts" (cache no members; stats counts are streamed from REST)
+MEMBER_CACHE_POLICY = os.getenv("MEMBER_CACHE_POLICY", "full")
+if MEMBER_CACHE_POLICY not in POLICIES:
+    print(f"⚠️  Unknown MEMBER_CACHE_POLICY '{MEMBER_CACHE_POLICY}', using full")
+    MEMBER_CACHE_POLICY = "full"
+
 # ------------------------ BOT SETUP ------------------------
 intents = discord.Intents.default()
-intents.members = True
+intents.members = True  # Join/leave events; how many members are cached is MEMBER_CACHE_POLICY
 intents.message_content = True
 intents.moderation = True  # For timeout/ban actions
 
-bot = commands.Bot(command_prefix="!", intents=intents)
+bot = commands.Bot(command_prefix="!", intents=intents, **cache_options(MEMBER_CACHE_POLICY, intents))
 
-# Rate limiting for server stats updates
-stats_update_cooldown = {}  # guild_id -> last_update_time
+# Stores backed by files under ./data, opened in setup_hook (see open_stores) so importing
+# this module never touches disk:
+# - per-guild settings (channels, moderation thresholds, template, feature toggles)
+guild_config = None
+# - warnings/timeouts ledger (SQLite WAL, written in batches off the event loop)
+infraction_ledger = None
+# - fingerprints of the last synced command tree per scope (skips redundant syncs)
+command_sync_state = None
+
+welcome_renderer = WelcomeRenderer(
+    CardLayout(
+        background_path=BACKGROUND_PATH,
+        font_path=FONT_PATH,
+        avatar_size=AVATAR_SIZE,
+        avatar_position=AVATAR_POSITION,
+        text=TEXT_BELOW_USERNAME,
+        text_position=TEXT_POSITION,
+        text_font_size=TEXT_FONT_SIZE,
+        text_color=TEXT_COLOR,
+        encoding=CARD_ENCODING,
+        quality=CARD_QUALITY,
+        compress_level=CARD_PNG_COMPRESS_LEVEL,
+        target_width=CARD_TARGET_WIDTH,
+        max_bytes=CARD_MAX_BYTES,
+    ),
+    workers=WELCOME_RENDER_WORKERS,
+    max_pending=WELCOME_RENDER_MAX_PENDING,
+    timeout=WELCOME_RENDER_TIMEOUT,
+    use_processes=WELCOME_RENDER_PROCESSES,
+    avatar_cache=AvatarCache(AVATAR_CACHE_DIR, max_items=AVATAR_CACHE_ITEMS, ttl=AVATAR_CACHE_TTL),
+    card_cache=CardCache(max_bytes=CARD_CACHE_BYTES),
+)
+
+# Per-guild total/human/bot counts, updated in O(1) from join/leave events
+member_counter = MemberCounter()
+member_recounts = {}  # guild_id -> running count task, shared by concurrent callers
+# Guilds counted at once (chunk requests / REST member pages); separate from the flush limit
+# because a flush may itself need a count
+MEMBER_COUNT_CONCURRENCY = int(os.getenv("MEMBER_COUNT_CONCURRENCY", "2"))
+member_count_limit = asyncio.Semaphore(max(1, MEMBER_COUNT_CONCURRENCY))
+STATS_RECONCILE_MINUTES = float(os.getenv("STATS_RECONCILE_MINUTES", "60"))
+
+# Minimum seconds between stats channel renames per guild (Discord allows 2 per 10 min per channel)
+STATS_RENAME_INTERVAL = float(os.getenv("STATS_RENAME_INTERVAL", "300"))
+STATS_MAX_CONCURRENCY = int(os.getenv("STATS_MAX_CONCURRENCY", "4"))
+
+# Periodic stats refresh: guilds are spread over this fraction of the 5-minute interval
+STATS_REFRESH_MINUTES = 5
+STATS_REFRESH_SPREAD = STATS_REFRESH_MINUTES * 60 * 0.8
+
+# Stats category/channel IDs per guild, resolved in O(1) instead of name scans (opened in setup_hook)
+STATS_CATEGORY_NAME = "📊 SERVER STATS 📊"
+STATS_CHANNELS = {"All Members": "total", "Members": "humans", "Bots": "bots"}
+STATS_STORE_PATH = os.getenv("STATS_STORE_PATH", "./data/stats_channels.json")
+stats_store = None
 
 # ------------------------ LOAD COGS ------------------------
+COGS = ["cogs.announce", "cogs.moderation", "cogs.config"]
+
 async def load_cogs():
-    try:
-        await bot.load_extension("cogs.announce")
-        print("✅ Successfully loaded announce cog")
-    except Exception as e:
-        print(f"❌ Failed to load announce cog: {e}")
-    
-    try:
-        await bot.load_extension("cogs.moderation")
-        print("✅ Successfully loaded moderation cog")
-    except Exception as e:
-        print(f"❌ Failed to load moderation cog: {e}")
+    async def load(extension):
+        name = extension.split(".")[-1]
+        if extension in bot.extensions:
+            return  # Already loaded (startup work must be safe to repeat)
+        try:
+            await bot.load_extension(extension)
+            print(f"✅ Successfully loaded {name} cog")
+        except Exception as e:
+            print(f"❌ Failed to load {name} cog: {e}")
+
+    # Extensions are independent, so load them concurrently
+    await asyncio.gather(*(load(extension) for extension in COGS))
+
+# ------------------------ STARTUP ------------------------
+PROCESS_STARTED = time.perf_counter()
+startup_timings = {}  # phase -> milliseconds, filled once per process
+startup_task = None
+
+def record_phase(name, started):
+    startup_timings[name] = (time.perf_counter() - started) * 1000
+    return time.perf_counter()
+
+def open_stores():
+    """Open the file-backed stores; cogs read them from the bot, so this runs before they load"""
+    global guild_config, infraction_ledger, command_sync_state, stats_store
+    guild_config = bot.guild_config = GuildConfigStore(GUILD_CONFIG_DB)
+    infraction_ledger = bot.infractions = InfractionLedger(INFRACTIONS_DB)
+    command_sync_state = CommandSyncState(COMMAND_SYNC_STATE)
+    stats_store = StatsChannelStore(STATS_STORE_PATH)
 
-# ------------------------ EVENTS ------------------------
 @bot.event
-async def on_ready():
-    print(f"✅ Logged in as {bot.user}")
-    print(f"Bot ID: {bot.user.id}")
-    print(f"Connected to {len(bot.guilds)} guild(s)")
-    
-    # Load cogs first
+async def setup_hook():
+    # Runs exactly once, after login and before the gateway connects
+    global startup_task
+    started = time.perf_counter()
+    open_stores()
+    started = record_phase("open stores", started)
     await load_cogs()
-    
-    # Wait a bit for cogs to load properly
-    await asyncio.sleep(1)
-    
-    # Sync the command tree to register slash commands
+    started = record_phase("cog load", started)
+
+    guild_config.warm()
+    infraction_ledger.start()
+    await welcome_renderer.start()
+    welcome_queue.start()
+    record_phase("cache warm", started)
+
+    # Work that needs the guild list waits for the first READY
+    startup_task = asyncio.create_task(finish_startup())
+
+async def finish_startup():
+    await bot.wait_until_ready()
+    started = time.perf_counter()
+
+    # Sync the command tree to register slash commands, skipping scopes that haven't changed
     try:
-        # First try syncing to all guilds (faster for testing)
-        for guild in bot.guilds:
-            bot.tree.copy_global_to(guild=guild)
-            synced = await bot.tree.sync(guild=guild)
-            print(f"✅ Synced {len(synced)} command(s) to guild: {guild.name}")
-        
-        # Also sync globally (takes up to 1 hour to propagate)
-        global_synced = await bot.tree.sync()
-        print(f"✅ Synced {len(global_synced)} global slash command(s)")
+        # Guild syncs are instant; the global sync takes up to 1 hour to propagate
+        synced, skipped = await sync_command_tree(bot.tree, bot.guilds, command_sync_state)
+        print(f"✅ Command sync: {len(synced)} sync call(s) made, {len(skipped)} avoided (tree unchanged)")
         
     except Exception as e:
         print(f"❌ Failed to sync commands: {e}")
+    started = record_phase("sync", started)
     
     try:
         await setup_server_stats()
-        refresh_server_stats.start()
+        if not refresh_server_stats.is_running():
+            refresh_server_stats.start()
+        if not reconcile_member_counts.is_running():
+            reconcile_member_counts.start()
         print("✅ Server stats system started successfully")
     except discord.Forbidden:
         print("⚠️  Bot does not have permission to manage channels. Server stats disabled.")
         print("💡 Use !getinvite or /invite to get a new invite link with proper permissions.")
     except Exception as e:
         print(f"❌ Error setting up server stats: {e}")
+    record_phase("stats setup", started)
+    startup_timings["time to ready"] = (time.perf_counter() - PROCESS_STARTED) * 1000
+
+    report = " | ".join(f"{phase} {ms:.0f} ms" for phase, ms in startup_timings.items())
+    print(f"⏱️ Startup timing: {report}")
+
+# ------------------------ EVENTS ------------------------
+@bot.event
+async def on_ready():
+    # Fires again on every reconnect; one-time startup lives in setup_hook/finish_startup
+    print(f"✅ Logged in as {bot.user}")
+    print(f"Bot ID: {bot.user.id}")
+    print(f"Connected to {len(bot.guilds)} guild(s)")
 
 @bot.event
 async def on_member_join(member):
-    # Only handle events for the main guild (avoid duplicate processing)
-    # Check if this is the correct guild by verifying channel exists
-    welcome_channel = bot.get_channel(WELCOME_CHANNEL_ID)
+    settings = guild_config.get(member.guild.id)
+    # Check the configured channel really belongs to this guild (avoid cross-guild posts)
+    welcome_channel = bot.get_channel(settings["welcome_channel_id"] or WELCOME_CHANNEL_ID)
     if welcome_channel and welcome_channel.guild.id == member.guild.id:
-        try:
-            await send_welcome_image(member, welcome_channel)
-        except Exception as e:
-            print(f"❌ Error sending welcome message: {e}")
+        if settings["welcome_enabled"]:
+            # Queued so a join burst is coalesced into a single welcome message
+            welcome_queue.enqueue(member, welcome_channel)
     else:
-        print(f"⚠️  Skipping welcome for {member.name} in {member.guild.name} (not main guild)")
+        print(f"⚠️  Skipping welcome for {member.name} in {member.guild.name} (no welcome channel configured)")
     
-    # Update server stats for this specific guild
-    try:
-        await update_server_stats(member.guild)
-    except Exception as e:
-        print(f"❌ Error updating server stats: {e}")
+    # Update server stats for this specific guild (flushed by the stats scheduler)
+    member_counter.member_joined(member)
+    stats_scheduler.mark_dirty(member.guild.id)
 
 @bot.event
-async def on_member_remove(member):
-    # Only handle events for the main guild (avoid duplicate processing)
-    # Check if this is the correct guild by verifying channel exists
-    leaving_channel = bot.get_channel(LEAVING_CHANNEL_ID)
-    if leaving_channel and leaving_channel.guild.id == member.guild.id:
-        try:
-            await send_leave_message(member, leaving_channel)
-        except Exception as e:
-            print(f"❌ Error sending leave message: {e}")
+async def on_raw_member_remove(payload):
+    # Raw event: on_member_remove only fires for cached members, and the lazy/counts
+    # cache policies don't keep everyone cached
+    guild = bot.get_guild(payload.guild_id)
+    if guild is None:
+        return
+    user = payload.user
+    settings = guild_config.get(guild.id)
+    # Check the configured channel really belongs to this guild (avoid cross-guild posts)
+    leaving_channel = bot.get_channel(settings["leaving_channel_id"] or LEAVING_CHANNEL_ID)
+    if leaving_channel and leaving_channel.guild.id == guild.id:
+        if settings["leave_enabled"]:
+            try:
+                await send_leave_message(user, leaving_channel)
+            except Exception as e:
+                print(f"❌ Error sending leave message: {e}")
     else:
-        print(f"⚠️  Skipping leave message for {member.name} in {member.guild.name} (not main guild)")
+        print(f"⚠️  Skipping leave message for {user.name} in {guild.name} (no leaving channel configured)")
     
-    # Update server stats for this specific guild
-    try:
-        await update_server_stats(member.guild)
-    except Exception as e:
-        print(f"❌ Error updating server stats: {e}")
+    # Update server stats for this specific guild (flushed by the stats scheduler)
+    member_counter.member_left(guild.id, user)
+    stats_scheduler.mark_dirty(guild.id)
+
+@bot.event
+async def on_guild_available(guild):
+    # Count once when the guild's member list is available; joins/leaves adjust it after.
+    # Without a full member cache the guild is counted the first time stats need it.
+    if guild.chunked:
+        member_counter.recount(guild)
+
+@bot.event
+async def on_guild_join(guild):
+    if guild.chunked:
+        member_counter.recount(guild)
+
+@bot.event
+async def on_guild_remove(guild):
+    member_counter.forget(guild)
+    stats_scheduler.forget(guild.id)
+    stats_store.forget(guild.id)
+
+@bot.event
+async def on_guild_channel_delete(channel):
+    # Repair the stats store and let the next flush recreate the channel
+    if stats_store.discard_channel(channel.guild.id, channel.id):
+        stats_scheduler.published.pop(channel.guild.id, None)
+        stats_scheduler.mark_dirty(channel.guild.id)
 
 # ------------------------ WELCOME / LEAVE IMAGE ------------------------
+def guild_card_layout(guild):
+    """Card layout using the guild's chosen template (falls back to the default background)"""
+    template = guild_config.get(guild.id)["template"]
+    background_path = os.path.join(os.path.dirname(BACKGROUND_PATH), f"{template}.png")
+    if background_path == BACKGROUND_PATH or not os.path.isfile(background_path):
+        return welcome_renderer.layout
+    return welcome_renderer.layout._replace(background_path=background_path)
+
 async def send_welcome_image(member, channel):
     # Safety check for channel
     if not channel:
@@ -139,55 +315,75 @@ async def send_welcome_image(member, channel):
         return
         
     try:
-        avatar_url = member.avatar.url if member.avatar else member.default_avatar.url
-        response = requests.get(avatar_url)
-        avatar = Image.open(BytesIO(response.content)).convert("RGBA")
-        avatar = avatar.resize(AVATAR_SIZE)
-
-        mask = Image.new("L", AVATAR_SIZE, 0)
-        draw_mask = ImageDraw.Draw(mask)
-        draw_mask.ellipse((0, 0, AVATAR_SIZE[0], AVATAR_SIZE[1]), fill=255)
-        avatar.putalpha(mask)
-
-        bg = Image.open(BACKGROUND_PATH).convert("RGBA")
-        bg.paste(avatar, AVATAR_POSITION, avatar)
-
-        if TEXT_BELOW_USERNAME:
-            draw = ImageDraw.Draw(bg)
-            try:
-                text_font = ImageFont.truetype(FONT_PATH, TEXT_FONT_SIZE)
-            except Exception:
-                text_font = ImageFont.load_default()
-            draw.text(TEXT_POSITION, TEXT_BELOW_USERNAME, font=text_font, fill=TEXT_COLOR)
-
-        buffer = BytesIO()
-        bg.save(buffer, format="PNG")
-        buffer.seek(0)
+        avatar = member.avatar or member.default_avatar
+        try:
+            buffer = await welcome_renderer.render(
+                avatar.url, avatar_hash=avatar.key, layout=guild_card_layout(member.guild)
+            )
+        except (RenderQueueFull, asyncio.TimeoutError) as e:
+            # Render pool is saturated: still welcome the member, just without the card
+            print(f"⚠️  Welcome card skipped for {member.name}: {e or 'render timed out'}")
+            buffer = None
 
-        file = discord.File(fp=buffer, filename="welcome.png")
         embed = discord.Embed(
             title=f"👋 Welcome to Only Gamers, {member.name}!",
             description="🎮 You're now part of the grind squad! Check rules and roles!",
             color=discord.Color.blue()
         )
-        embed.set_image(url="attachment://welcome.png")
         embed.set_footer(text="Only Gamers • Respect. Play. Repeat.")
         embed.add_field(name="📅 Joined", value=f"<t:{int(member.joined_at.timestamp())}:R>", inline=True)
         embed.add_field(name="🔹 You are member", value=str(member.guild.member_count), inline=True)
 
-        await channel.send(content=member.mention, file=file, embed=embed)
+        if buffer is not None:
+            filename = card_filename(buffer.getbuffer())
+            file = discord.File(fp=buffer, filename=filename)
+            embed.set_image(url=f"attachment://{filename}")
+            await channel.send(content=member.mention, file=file, embed=embed)
+        else:
+            await channel.send(content=member.mention, embed=embed)
         print(f"✅ Sent welcome message for {member.name} to {channel.name}")
         
     except Exception as e:
         print(f"❌ Error in send_welcome_image: {e}")
 
+async def send_welcome_batch(members, channel):
+    """Welcome a burst of members with a single embed instead of one card each"""
+    if not channel.permissions_for(channel.guild.me).send_messages:
+        print(f"❌ Cannot send welcome message: no permission in {channel.name}")
+        return
+
+    embed = discord.Embed(
+        title=f"👋 Welcome to Only Gamers, {len(members)} new members!",
+        description="🎮 You're all now part of the grind squad! Check rules and roles!",
+        color=discord.Color.blue()
+    )
+    embed.add_field(
+        name="🎉 New Members",
+        value="\n".join(f"• {m.mention} ({m.name})" for m in members)[:1024],
+        inline=False
+    )
+    embed.add_field(name="👥 Member Count", value=str(channel.guild.member_count), inline=True)
+    embed.set_footer(text="Only Gamers • Respect. Play. Repeat.")
+
+    await channel.send(content=" ".join(m.mention for m in members), embed=embed)
+    print(f"✅ Sent batched welcome for {len(members)} members to {channel.name}")
+
+welcome_queue = WelcomeQueue(
+    send_welcome_image,
+    send_welcome_batch,
+    window=WELCOME_COALESCE_WINDOW,
+    max_batch=WELCOME_BATCH_SIZE,
+    max_size=WELCOME_QUEUE_SIZE,
+)
+
 async def send_leave_message(member, channel):
+    # `member` may be a plain User (they already left), so the guild comes from the channel
     # Safety check for channel
     if not channel:
         print(f"❌ Cannot send leave message: channel is None")
         return
         
-    if not channel.permissions_for(member.guild.me).send_messages:
+    if not channel.permissions_for(channel.guild.me).send_messages:
         print(f"❌ Cannot send leave message: no permission in {channel.name}")
         return
         
@@ -199,7 +395,7 @@ async def send_leave_message(member, channel):
         )
         embed.set_footer(text="Only Gamers • Respect. Play. Repeat.")
         embed.add_field(name="📅 Left", value=f"<t:{int(discord.utils.utcnow().timestamp())}:R>", inline=True)
-        embed.add_field(name="👥 Members Remaining", value=str(member.guild.member_count), inline=True)
+        embed.add_field(name="👥 Members Remaining", value=str(channel.guild.member_count), inline=True)
         
         await channel.send(embed=embed)
         print(f"✅ Sent leave message for {member.name} to {channel.name}")
@@ -208,82 +404,171 @@ async def send_leave_message(member, channel):
         print(f"❌ Error in send_leave_message: {e}")
 
 # ------------------------ SERVER STATS ------------------------
-@tasks.loop(minutes=5)
-async def refresh_server_stats():
+async def recount_members(guild):
+    """Count a guild per MEMBER_CACHE_POLICY without needing its full member list; returns drift"""
+    task = member_recounts.get(guild.id)
+    if task is None:
+        task = member_recounts[guild.id] = asyncio.create_task(limited_count_members(guild))
+        task.add_done_callback(lambda _: member_recounts.pop(guild.id, None))
+    return member_counter.update(guild.id, await asyncio.shield(task))
+
+async def limited_count_members(guild):
+    async with member_count_limit:
+        return await count_members(guild, chunk=MEMBER_CACHE_POLICY != "counts")
+
+async def guild_member_counts(guild):
+    """Tracked counts for a guild, counted the first time they are needed"""
+    counts = member_counter.counts.get(guild.id)
+    if counts is None:
+        await recount_members(guild)
+        counts = member_counter.counts[guild.id]
+    return counts
+
+@tasks.loop(minutes=STATS_RECONCILE_MINUTES)
+async def reconcile_member_counts():
+    # Full recount to correct any drift from missed or duplicated member events
     for guild in bot.guilds:
+        if guild.chunked:
+            drift = member_counter.recount(guild)
+        elif guild.id in member_counter.counts:
+            try:
+                drift = await recount_members(guild)
+            except discord.HTTPException as e:
+                print(f"❌ Error recounting members in {guild.name}: {e}")
+                continue
+        else:
+            continue  # Never needed (stats off), so don't pay for a count
+        if drift:
+            print(f"🔧 Corrected member count drift of {drift} in {guild.name}")
+
+@tasks.loop(minutes=STATS_REFRESH_MINUTES)
+async def refresh_server_stats():
+    started = time.perf_counter()
+    calls_before = stats_scheduler.stats["api_calls"]
+    changed = 0
+
+    async def refresh_guild(guild):
+        nonlocal changed
+        # Each guild gets a hashed, jittered slot so REST calls don't all land at once
+        await asyncio.sleep(slot_delay(guild.id, STATS_REFRESH_SPREAD))
+        if not guild_config.get(guild.id)["stats_enabled"]:
+            return
         try:
-            await update_server_stats(guild)
-        except discord.Forbidden:
-            print(f"❌ Missing permissions to update stats in {guild.name}")
+            counts = await guild_member_counts(guild)
+        except discord.HTTPException as e:
+            print(f"❌ Error counting members in {guild.name}: {e}")
+            return
+        if stats_scheduler.changed(guild.id, counts):
+            changed += 1
+            stats_scheduler.mark_dirty(guild.id)
+
+    await asyncio.gather(*(refresh_guild(guild) for guild in bot.guilds))
+
+    # Let the flushes from the last slots finish before reporting
+    while stats_scheduler.in_flight:
+        await asyncio.sleep(1)
+    print(
+        f"📊 Stats refresh: {len(bot.guilds)} guild(s), {changed} changed, "
+        f"{stats_scheduler.stats['api_calls'] - calls_before} API call(s) in "
+        f"{time.perf_counter() - started:.1f}s"
+    )
 
 async def setup_server_stats():
+    stats_scheduler.start()
     for guild in bot.guilds:
-        try:
-            await update_server_stats(guild)
-        except discord.Forbidden:
-            print(f"⚠️  Missing permissions for server stats in {guild.name}")
-        except Exception as e:
-            print(f"❌ Error setting up server stats in {guild.name}: {e}")
+        stats_scheduler.mark_dirty(guild.id)
+
+async def flush_server_stats(guild_id):
+    guild = bot.get_guild(guild_id)
+    if guild:
+        await update_server_stats(guild)
+
+stats_scheduler = StatsScheduler(
+    flush_server_stats,
+    min_interval=STATS_RENAME_INTERVAL,
+    max_concurrency=STATS_MAX_CONCURRENCY,
+)
+
+async def resolve_stats_category(guild):
+    """Stored category by ID; on a miss, repair from a name lookup or create it"""
+    category = guild.get_channel(stats_store.get(guild.id, "category") or 0)
+    if isinstance(category, discord.CategoryChannel):
+        return category
+
+    category = discord.utils.get(guild.categories, name=STATS_CATEGORY_NAME)
+    if not category:
+        category = await guild.create_category(STATS_CATEGORY_NAME)
+        stats_scheduler.stats["api_calls"] += 1
+    stats_store.set(guild.id, "category", category.id)
+    return category
+
+async def resolve_stats_channel(guild, category, base_name, new_name):
+    """Stored stats channel by ID; on a miss, repair from the category or create it"""
+    channel = guild.get_channel(stats_store.get(guild.id, base_name) or 0)
+    if isinstance(channel, discord.VoiceChannel):
+        if channel.category_id != category.id:
+            # The category was deleted and recreated; bring the channel back into it
+            try:
+                await channel.edit(category=category)
+                stats_scheduler.stats["api_calls"] += 1
+            except (discord.Forbidden, discord.HTTPException) as e:
+                print(f"⚠️  Could not move {channel.name} into {category.name} in {guild.name}: {e}")
+        return channel
+
+    # Lookup miss: adopt an existing channel (e.g. from before IDs were stored)
+    pattern_channels = [
+        ch for ch in category.voice_channels
+        if ch.name.startswith(f"{base_name}:")
+    ]
+    if pattern_channels:
+        channel = pattern_channels[0]
+        for duplicate in pattern_channels[1:]:
+            try:
+                await duplicate.delete()
+                stats_scheduler.stats["api_calls"] += 1
+                print(f"🗑️ Deleted duplicate stats channel: {duplicate.name} in {guild.name}")
+            except discord.Forbidden:
+                pass
+    else:
+        overwrites = {
+            guild.default_role: discord.PermissionOverwrite(connect=False)
+        }
+        channel = await guild.create_voice_channel(new_name, category=category, overwrites=overwrites)
+        stats_scheduler.stats["api_calls"] += 1
+
+    stats_store.set(guild.id, base_name, channel.id)
+    return channel
 
 async def update_server_stats(guild):
-    # Rate limiting: only update stats every 30 seconds per guild
-    import time
-    now = time.time()
-    guild_id = guild.id
-    
-    if guild_id in stats_update_cooldown:
-        if now - stats_update_cooldown[guild_id] < 30:  # 30 second cooldown
-            return  # Skip update if too recent
-    
-    stats_update_cooldown[guild_id] = now
-    
+    if not guild_config.get(guild.id)["stats_enabled"]:
+        return
+
     # Check if bot has necessary permissions
     bot_member = guild.get_member(bot.user.id)
     if not bot_member or not bot_member.guild_permissions.manage_channels:
         return  # Silently skip if no permissions
-        
-    category_name = "📊 SERVER STATS 📊"
-    voice_names = {
-        "All Members": lambda g: f"All Members: {g.member_count}",
-        "Members": lambda g: f"Members: {len([m for m in g.members if not m.bot])}",
-        "Bots": lambda g: f"Bots: {len([m for m in g.members if m.bot])}"
-    }
 
     try:
-        category = discord.utils.get(guild.categories, name=category_name)
-        if not category:
-            category = await guild.create_category(category_name)
+        counts = await guild_member_counts(guild)
+
+        # One updater per guild at a time, so concurrent calls can't create duplicates
+        async with stats_store.lock(guild.id):
+            category = await resolve_stats_category(guild)
+
+            for base_name, key in STATS_CHANNELS.items():
+                new_name = f"{base_name}: {counts[key]}"
+                channel = await resolve_stats_channel(guild, category, base_name, new_name)
+
+                if channel.name != new_name:
+                    await channel.edit(name=new_name)
+                    stats_scheduler.stats["renames_performed"] += 1
+                    stats_scheduler.stats["api_calls"] += 1
+                else:
+                    stats_scheduler.stats["renames_skipped"] += 1
+
+        # Remember what the channels show so unchanged guilds cost no API calls next cycle
+        stats_scheduler.published[guild.id] = dict(counts)
 
-        # Check for existing channels and clean up duplicates
-        for base_name, name_fn in voice_names.items():
-            new_name = name_fn(guild)
-            
-            # Find all channels that match the pattern (e.g., "All Members: X")
-            pattern_channels = [
-                ch for ch in category.voice_channels 
-                if ch.name.startswith(f"{base_name}:")
-            ]
-            
-            if pattern_channels:
-                # Keep the first one, update its name if needed
-                target_channel = pattern_channels[0]
-                if target_channel.name != new_name:
-                    await target_channel.edit(name=new_name)
-                
-                # Delete any duplicates
-                for duplicate in pattern_channels[1:]:
-                    try:
-                        await duplicate.delete()
-                        print(f"🗑️ Deleted duplicate stats channel: {duplicate.name} in {guild.name}")
-                    except discord.Forbidden:
-                        pass
-            else:
-                # No existing channel, create new one
-                overwrites = {
-                    guild.default_role: discord.PermissionOverwrite(connect=False)
-                }
-                await guild.create_voice_channel(new_name, category=category, overwrites=overwrites)
-                
     except discord.Forbidden:
         # Permissions were revoked during execution
         pass
@@ -295,6 +580,44 @@ async def update_server_stats(guild):
 async def test_welcome(ctx):
     await send_welcome_image(ctx.author, ctx.channel)
 
+@bot.command(name="welcomestats")
+async def welcome_stats(ctx):
+    """Show welcome card render pool status"""
+    status = welcome_renderer.status()
+    embed = discord.Embed(
+        title="🖼️ Welcome Render Pool",
+        color=discord.Color.blue()
+    )
+    embed.add_field(
+        name="⚙️ Pool",
+        value=f"• Type: {status['pool']}\n• Workers: {status['workers']}\n• Pending: {status['pending']}/{status['max_pending']}",
+        inline=False
+    )
+    embed.add_field(
+        name="📈 Renders",
+        value=f"• Rendered: {status['rendered']}\n• Rejected (queue full): {status['rejected']}\n• Timeouts: {status['timeouts']}\n• Failed: {status['failed']}\n• Last/avg render: {status['last_render_ms']:.0f}/{status['avg_render_ms']:.0f} ms",
+        inline=False
+    )
+    cache = welcome_renderer.avatar_cache.status()
+    embed.add_field(
+        name="🗃️ Avatar Cache",
+        value=f"• Items: {cache['items']}/{cache['max_items']} ({cache['memory_bytes'] // 1024} KB)\n• Hits: {cache['memory_hits']} memory, {cache['disk_hits']} disk\n• Misses: {cache['misses']} ({cache['hit_rate']:.0%} hit rate)\n• Evictions: {cache['memory_evictions']} memory, {cache['disk_evictions']} disk",
+        inline=False
+    )
+    cards = welcome_renderer.card_cache.status()
+    embed.add_field(
+        name="💾 Card Cache",
+        value=f"• Items: {cards['items']} ({cards['bytes'] // 1024}/{cards['max_bytes'] // 1024} KB)\n• Hits: {cards['hits']} • Misses: {cards['misses']}\n• Evictions: {cards['evictions']} • Invalidations: {cards['invalidations']}",
+        inline=False
+    )
+    queue = welcome_queue.status()
+    embed.add_field(
+        name="📬 Welcome Queue",
+        value=f"• Depth: {queue['depth']}/{queue['max_size']} (window {queue['window']:g}s)\n• Single: {queue['single_sends']} • Batched: {queue['batch_sends']} ({queue['batched_members']} members)\n• Dropped: {queue['dropped']} ({queue['drop_rate']:.1%}) • Duplicates: {queue['duplicates']}",
+        inline=False
+    )
+    await ctx.send(embed=embed)
+
 @bot.command(name="testleave")
 async def test_leave(ctx):
     await send_leave_message(ctx.author, ctx.channel)
@@ -304,6 +627,75 @@ async def manual_refresh(ctx):
     await update_server_stats(ctx.guild)
     await ctx.send("✅ Server stats refreshed.")
 
+@bot.command(name="statsinfo")
+async def stats_info(ctx):
+    """Show server stats scheduler metrics"""
+    status = stats_scheduler.status()
+    counts = await guild_member_counts(ctx.guild)
+    embed = discord.Embed(
+        title="📊 Server Stats Scheduler",
+        color=discord.Color.blue()
+    )
+    embed.add_field(
+        name="👥 Tracked Counts",
+        value=f"• Total: {counts['total']}\n• Members: {counts['humans']}\n• Bots: {counts['bots']}",
+        inline=True
+    )
+    embed.add_field(
+        name="🔄 Renames",
+        value=f"• Performed: {status['renames_performed']}\n• Skipped (unchanged): {status['renames_skipped']}\n• Coalesced events: {status['coalesced']}",
+        inline=True
+    )
+    embed.add_field(
+        name="⏱️ Scheduler",
+        value=f"• Dirty guilds: {status['dirty']}\n• Flushes: {status['flushes']}\n• Min interval: {status['min_interval']:g}s\n• API calls: {status['api_calls']}",
+        inline=True
+    )
+    await ctx.send(embed=embed)
+
+@bot.command(name="memstats")
+async def mem_stats(ctx):
+    """Show member cache size per guild and process memory - Admin only"""
+    if not ctx.author.guild_permissions.administrator:
+        await ctx.send("❌ You need administrator permissions to use this command.")
+        return
+
+    report = cache_report(bot.guilds)
+    cached = sum(entry["cached"] for entry in report)
+    reported = sum(entry["member_count"] for entry in report)
+    cache_bytes = sum(entry["bytes"] for entry in report)
+    rss = process_rss()
+
+    embed = discord.Embed(
+        title="🧠 Member Cache & Memory",
+        color=discord.Color.blue()
+    )
+    embed.add_field(
+        name="⚙️ Policy",
+        value=f"• Policy: {MEMBER_CACHE_POLICY}\n• Chunk at startup: {'Yes' if MEMBER_CACHE_POLICY == 'full' else 'No'}\n• Counts tracked: {len(member_counter.counts)} guild(s)",
+        inline=True
+    )
+    embed.add_field(
+        name="👥 Cache",
+        value=f"• Members: {cached:,} of {reported:,}\n• Users: {len(bot.users):,}\n• Approx size: {cache_bytes / 1024 / 1024:.1f} MB",
+        inline=True
+    )
+    embed.add_field(
+        name="💾 Process",
+        value=f"• RSS: {rss / 1024 / 1024:.1f} MB" if rss else "• RSS: unavailable",
+        inline=True
+    )
+    embed.add_field(
+        name="🏰 Largest Caches",
+        value="\n".join(
+            f"• {entry['guild'].name}: {entry['cached']:,}/{entry['member_count']:,} "
+            f"(~{entry['bytes'] // 1024:,} KB{', chunked' if entry['chunked'] else ''})"
+            for entry in report[:10]
+        )[:1024] or "No guilds",
+        inline=False
+    )
+    await ctx.send(embed=embed)
+
 @bot.command(name="cleanstats")
 async def clean_stats(ctx):
     """Clean up duplicate server stats channels - Admin only"""
@@ -312,8 +704,9 @@ async def clean_stats(ctx):
         return
     
     try:
-        category_name = "📊 SERVER STATS 📊"
-        category = discord.utils.get(ctx.guild.categories, name=category_name)
+        category = ctx.guild.get_channel(stats_store.get(ctx.guild.id, "category") or 0)
+        if not isinstance(category, discord.CategoryChannel):
+            category = discord.utils.get(ctx.guild.categories, name=STATS_CATEGORY_NAME)
         
         if not category:
             await ctx.send("❌ No server stats category found.")
@@ -321,18 +714,24 @@ async def clean_stats(ctx):
         
         # Count and clean duplicates
         cleaned_count = 0
-        base_names = ["All Members", "Members", "Bots"]
         
-        for base_name in base_names:
-            # Find all channels that match the pattern
-            pattern_channels = [
-                ch for ch in category.voice_channels 
-                if ch.name.startswith(f"{base_name}:")
-            ]
-            
-            if len(pattern_channels) > 1:
-                # Keep the first one, delete the rest
-                for duplicate in pattern_channels[1:]:
+        async with stats_store.lock(ctx.guild.id):
+            for base_name in STATS_CHANNELS:
+                # Find all channels that match the pattern
+                pattern_channels = [
+                    ch for ch in category.voice_channels 
+                    if ch.name.startswith(f"{base_name}:")
+                ]
+                if not pattern_channels:
+                    continue
+                
+                # Keep the stored channel (or the first one), delete the rest
+                stored_id = stats_store.get(ctx.guild.id, base_name)
+                keep = next((ch for ch in pattern_channels if ch.id == stored_id), pattern_channels[0])
+                stats_store.set(ctx.guild.id, base_name, keep.id)
+                for duplicate in pattern_channels:
+                    if duplicate.id == keep.id:
+                        continue
                     try:
                         await duplicate.delete()
                         cleaned_count += 1
@@ -350,20 +749,25 @@ async def clean_stats(ctx):
         await ctx.send(f"❌ Error cleaning stats: {e}")
 
 @bot.command(name="synccommands")
-async def sync_commands(ctx):
-    """Debug command to manually sync slash commands"""
+async def sync_commands(ctx, mode: str = ""):
+    """Debug command to manually sync slash commands (`!synccommands force` ignores the fingerprint)"""
     if not ctx.author.guild_permissions.administrator:
         await ctx.send("❌ You need administrator permissions to use this command.")
         return
     
+    force = mode.lower() == "force"
     try:
         # Sync to current guild
-        bot.tree.copy_global_to(guild=ctx.guild)
-        synced = await bot.tree.sync(guild=ctx.guild)
-        await ctx.send(f"✅ Synced {len(synced)} command(s) to this guild!")
+        synced, _ = await sync_command_tree(
+            bot.tree, [ctx.guild], command_sync_state, force=force, include_global=False
+        )
+        commands_list = [cmd.name for cmd in bot.tree.get_commands(guild=ctx.guild)]
+        if synced:
+            await ctx.send(f"✅ Synced {len(commands_list)} command(s) to this guild!")
+        else:
+            await ctx.send("✅ Commands are already up to date. Use `!synccommands force` to sync anyway.")
         
         # List the synced commands
-        commands_list = [cmd.name for cmd in synced]
         if commands_list:
             await ctx.send(f"📋 Commands: {', '.join(commands_list)}")
             
@@ -591,9 +995,43 @@ async def moderation_status(ctx):
         )
         
         # Get current settings
+        settings = guild_config.get(ctx.guild.id)
         embed.add_field(
             name="⚙️ Current Settings",
-            value=f"• Spam Threshold: {mod_cog.spam_threshold} messages\n• Spam Timeframe: {mod_cog.spam_timeframe} seconds\n• Max Warnings: {mod_cog.max_warnings}",
+            value=f"• Spam Threshold: {settings['spam_threshold']} messages\n• Spam Timeframe: {settings['spam_timeframe']} seconds\n• Max Warnings: {mod_cog.max_warnings}",
+            inline=False
+        )
+
+        state = mod_cog.state_status()
+        embed.add_field(
+            name="🧠 Tracked State",
+            value=f"• Users: {state['tracked_users']} ({state['bytes'] // 1024} KB)\n• Spam windows: {state['spam_tracked']} • Warned: {state['warned']} • Locks: {state['locks']} • Message IDs: {state['message_ids']}\n• Expired: {state['expired']} over {state['sweeps']} sweep(s), idle TTL {state['ttl']:g}s",
+            inline=False
+        )
+        deletes = state["deletes"]
+        embed.add_field(
+            name="🗑️ Spam Deletes",
+            value=f"• Incidents: {deletes['incidents']} ({deletes['buffer_deletes']} from buffer, {deletes['history_fallbacks']} via history)\n• History fetches saved: {deletes['rest_calls_saved']}",
+            inline=False
+        )
+        actions = state["actions"]
+        depth = actions["depth_by_priority"]
+        embed.add_field(
+            name="⚡ Action Queue",
+            value=f"• Queued: {actions['depth']} ({depth['deletes']} deletes, {depth['timeouts']} timeouts, {depth['notices']} notices) • Workers: {actions['workers']}\n• Executed: {actions['executed']} • Failed: {actions['failed']} • Dropped: {actions['dropped']}\n• Coalesced: {actions['coalesced']} • Deduplicated: {actions['deduplicated']} • API calls: {actions['api_calls']}\n• Latency: {actions['avg_latency_ms']:.0f} ms avg, {actions['max_latency_ms']:.0f} ms max",
+            inline=False
+        )
+        notices = state["notices"]
+        next_due = f"{notices['next_due_in']:.0f}s" if notices["next_due_in"] is not None else "—"
+        embed.add_field(
+            name="⏳ Scheduled Notice Deletions",
+            value=f"• Pending: {notices['pending']} (next in {next_due}) • Restored at startup: {notices['restored']}\n• Expired: {notices['expired']} in {notices['batches']} channel batch(es)",
+            inline=False
+        )
+        modlog = state["modlog"]
+        embed.add_field(
+            name="📋 Mod Log Targets",
+            value=f"• Cached guilds: {modlog['cached']} • Hits: {modlog['hits']} • Resolves: {modlog['misses']} • Invalidations: {modlog['invalidations']}",
             inline=False
         )
         
@@ -643,7 +1081,7 @@ async def bot_info(interaction: discord.Interaction):
     
     embed.add_field(
         name="📋 Available Slash Commands",
-        value="• `/announce` - Send announcements (Admin only)\n• `/botinfo` - Show this information\n• `/clear` - Clear messages (Mod only)\n• `/timeout` - Timeout users (Mod only)\n• `/modconfig` - Configure moderation (Admin only)",
+        value="• `/announce` - Send announcements (Admin only)\n• `/botinfo` - Show this information\n• `/clear` - Clear messages (Mod only)\n• `/timeout` - Timeout users (Mod only)\n• `/warnings` - Member warnings and history (Mod only)\n• `/modconfig` - Configure moderation (Admin only)\n• `/config` - Per-server channels, template and features (Admin only)",
         inline=False
     )
     
@@ -714,8 +1152,18 @@ async def invite_bot(interaction: discord.Interaction):
 # ------------------------ MAIN ENTRY ------------------------
 async def main():
     keep_alive()
-    async with bot:
-        # Don't load cogs here, do it in on_ready
-        await bot.start(TOKEN)
+    try:
+        async with bot:
+            # Cogs, caches and the render pool are set up in setup_hook
+            await bot.start(TOKEN)
+    finally:
+        await welcome_queue.close()
+        await welcome_renderer.close()
+        # Not opened if login failed before setup_hook
+        if infraction_ledger is not None:
+            await infraction_ledger.close()
+        if guild_config is not None:
+            guild_config.close()
 
-asyncio.run(main())
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,114 @@
+"""
+Member cache policy and memory reporting.
+
+With the members intent discord.py chunks and caches every member of every
+guild at startup by default, which dominates RSS and startup time on large
+guilds. The policy picks how much of that the bot keeps:
+
+- "full":   chunk every guild at startup and cache all members (the old default)
+- "lazy":   cache members as they show up in events; guilds that use server
+            stats are chunked the first time their counts are needed
+- "counts": cache no members besides the bot itself; stats counts are streamed
+            from REST when needed and then kept up to date from join/leave events
+"""
+import array
+import datetime
+import os
+import sys
+
+import discord
+
+POLICIES = ("full", "lazy", "counts")
+
+# Slot values that belong to a single cached object (shared objects like the
+# connection state or the guild are deliberately not counted)
+_OWNED_TYPES = (int, float, str, bytes, tuple, list, dict, array.array, datetime.datetime)
+
+
+def cache_options(policy, intents):
+    """Keyword arguments for commands.Bot that implement a member cache policy"""
+    if policy == "full":
+        return {
+            "chunk_guilds_at_startup": True,
+            "member_cache_flags": discord.MemberCacheFlags.from_intents(intents),
+        }
+    if policy == "lazy":
+        return {
+            "chunk_guilds_at_startup": False,
+            "member_cache_flags": discord.MemberCacheFlags.from_intents(intents),
+        }
+    return {
+        "chunk_guilds_at_startup": False,
+        "member_cache_flags": discord.MemberCacheFlags.none(),
+    }
+
+
+def _owned_size(obj, depth=1):
+    """Shallow size of a slotted object plus the values it owns (one level into its user)"""
+    size = sys.getsizeof(obj)
+    for cls in type(obj).__mro__:
+        slots = cls.__dict__.get("__slots__", ())
+        if isinstance(slots, str):
+            slots = (slots,)
+        for name in slots:
+            value = getattr(obj, name, None)
+            if value is None or isinstance(value, bool):
+                continue
+            if isinstance(value, _OWNED_TYPES):
+                size += sys.getsizeof(value)
+            elif depth and isinstance(value, discord.user.BaseUser):
+                size += _owned_size(value, depth - 1)
+    return size
+
+
+def approx_member_bytes(members, sample=50):
+    """Average size of a cached Member, estimated from the first `sample` members"""
+    sizes = []
+    for member in members:
+        sizes.append(_owned_size(member))
+        if len(sizes) >= sample:
+            break
+    return sum(sizes) / len(sizes) if sizes else 0
+
+
+def process_rss():
+    """Current resident set size in bytes, or the peak RSS where /proc isn't available"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def cache_report(guilds):
+    """
+    Approximate member cache size per guild, largest first.
+
+    Returns a list of {"guild", "cached", "member_count", "chunked", "bytes"};
+    the per-member size is sampled once and applied to every guild.
+    """
+    guilds = list(guilds)
+    member_bytes = 0
+    for guild in guilds:
+        if guild.members:
+            member_bytes = approx_member_bytes(guild.members)
+            break
+
+    report = [
+        {
+            "guild": guild,
+            "cached": len(guild.members),
+            "member_count": guild.member_count or 0,
+            "chunked": guild.chunked,
+            "bytes": int(len(guild.members) * member_bytes),
+        }
+        for guild in guilds
+    ]
+    report.sort(key=lambda entry: entry["cached"], reverse=True)
+    return report
@@ -0,0 +1,226 @@
+"""
+Single executor for moderation side effects.
+
+Every delete, timeout and notice goes through one priority queue instead of
+being fired off as its own task, so under a spam wave the actions that stop
+the spam (deletes, then timeouts) always run before the notices about it.
+While actions wait their turn:
+
+- deletes in the same channel merge into one bulk delete,
+- a keyed action (e.g. a timeout for a member) that is submitted again
+  replaces the pending one instead of running twice, unless the pending
+  one has a higher rank (e.g. a longer timeout).
+"""
+import asyncio
+import itertools
+import time
+
+# Lower runs first
+DELETE = 0
+TIMEOUT = 1
+NOTICE = 2
+PRIORITY_NAMES = {DELETE: "deletes", TIMEOUT: "timeouts", NOTICE: "notices"}
+
+# Discord's bulk delete limit
+BULK_DELETE_MAX = 100
+
+
+class _Action:
+    __slots__ = ("priority", "seq", "key", "run", "rank", "bulk_delete", "future", "queued_at")
+
+    def __init__(self, priority, seq, key, run, rank=None, bulk_delete=False):
+        self.priority = priority
+        self.seq = seq
+        self.key = key
+        self.run = run  # async () -> result
+        self.rank = rank  # Keyed actions only: a lower-ranked resubmission doesn't replace this one
+        self.bulk_delete = bulk_delete  # Counts its own API calls
+        self.future = asyncio.get_running_loop().create_future()
+        self.queued_at = time.perf_counter()
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class ModActionExecutor:
+    def __init__(self, workers=2, max_pending=1000):
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self.queue = None
+        self.tasks = []
+        self.seq = itertools.count()
+        self.pending = {}  # key -> queued _Action (not started yet)
+        self.deletes = {}  # (channel_id, priority) -> {message_id: future} for the queued bulk delete
+        self.depth = {priority: 0 for priority in PRIORITY_NAMES}
+
+        self.stats = {
+            "submitted": 0,
+            "executed": 0,
+            "failed": 0,
+            "dropped": 0,
+            "coalesced": 0,
+            "deduplicated": 0,
+            "api_calls": 0,
+            "total_latency_ms": 0.0,
+            "max_latency_ms": 0.0,
+        }
+
+    def start(self):
+        if self.queue is None:
+            self.queue = asyncio.PriorityQueue()
+        self.tasks = [task for task in self.tasks if not task.done()]
+        while len(self.tasks) < self.workers:
+            self.tasks.append(asyncio.create_task(self._worker()))
+
+    async def close(self):
+        for task in self.tasks:
+            task.cancel()
+        for task in self.tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self.tasks = []
+        if self.queue is not None:
+            while not self.queue.empty():
+                self.queue.get_nowait().future.cancel()
+        for batch in self.deletes.values():
+            for future in batch.values():
+                future.cancel()
+        self.pending.clear()
+        self.deletes.clear()
+
+    def _enqueue(self, priority, key, run, rank=None, bulk_delete=False):
+        if self.queue is None:
+            self.start()
+        self.stats["submitted"] += 1
+        if self.queue.qsize() >= self.max_pending:
+            self.stats["dropped"] += 1
+            future = asyncio.get_running_loop().create_future()
+            future.cancel()
+            return None, future
+        action = _Action(priority, next(self.seq), key, run, rank, bulk_delete)
+        self.queue.put_nowait(action)
+        self.depth[priority] += 1
+        return action, action.future
+
+    def run(self, priority, run, key=None, on_done=None, rank=None):
+        """
+        Queue `run` (an async callable) at `priority`; returns a future for its
+        result (None if it raised, cancelled if the queue was full).
+
+        If an action with the same `key` is still waiting, it is replaced by
+        this one (unless it has a higher `rank`, then this one is dropped) and
+        the same future is returned (`on_done` is only attached the first time).
+        """
+        if key is not None:
+            queued = self.pending.get(key)
+            if queued is not None:
+                if rank is None or queued.rank is None or rank >= queued.rank:
+                    queued.run = run
+                    queued.rank = rank
+                self.stats["submitted"] += 1
+                self.stats["deduplicated"] += 1
+                return queued.future
+
+        action, future = self._enqueue(priority, key, run, rank)
+        if action is not None and key is not None:
+            self.pending[key] = action
+        if on_done is not None:
+            future.add_done_callback(on_done)
+        return future
+
+    def delete(self, channel, message_id, priority=DELETE):
+        """Queue a message delete; deletes queued for the same channel run as one bulk delete"""
+        group = (channel.id, priority)
+        batch = self.deletes.get(group)
+        if batch is not None and message_id in batch:
+            self.stats["submitted"] += 1
+            self.stats["deduplicated"] += 1
+            return batch[message_id]
+        if batch is not None and len(batch) < BULK_DELETE_MAX:
+            self.stats["submitted"] += 1
+            self.stats["coalesced"] += 1
+            future = batch[message_id] = asyncio.get_running_loop().create_future()
+            return future
+
+        batch = {}
+
+        async def run():
+            # Later deletes for this channel start a new batch once this one runs
+            if self.deletes.get(group) is batch:
+                del self.deletes[group]
+            return await self._bulk_delete(channel, batch)
+
+        action, future = self._enqueue(priority, None, run, bulk_delete=True)
+        if action is None:
+            return future
+        batch[message_id] = asyncio.get_running_loop().create_future()
+        self.deletes[group] = batch
+        return batch[message_id]
+
+    def pending_rank(self, key):
+        """Rank of the action waiting under `key` (None if nothing is waiting)"""
+        queued = self.pending.get(key)
+        return None if queued is None else queued.rank
+
+    async def _bulk_delete(self, channel, batch):
+        ids = list(batch)
+        deleted = set()
+        try:
+            self.stats["api_calls"] += 1
+            if len(ids) == 1:
+                await channel.get_partial_message(ids[0]).delete()
+            else:
+                await channel.delete_messages([channel.get_partial_message(i) for i in ids])
+            deleted.update(ids)
+        except Exception:
+            # Bulk delete refuses the whole batch if any message is too old; retry one by one
+            for message_id in ids if len(ids) > 1 else ():
+                try:
+                    self.stats["api_calls"] += 1
+                    await channel.get_partial_message(message_id).delete()
+                    deleted.add(message_id)
+                except Exception:
+                    pass
+        for message_id, future in batch.items():
+            if not future.done():
+                future.set_result(message_id in deleted)
+        return len(deleted)
+
+    async def _worker(self):
+        while True:
+            action = await self.queue.get()
+            self.depth[action.priority] -= 1
+            if action.key is not None and self.pending.get(action.key) is action:
+                del self.pending[action.key]
+
+            latency_ms = (time.perf_counter() - action.queued_at) * 1000
+            self.stats["total_latency_ms"] += latency_ms
+            self.stats["max_latency_ms"] = max(self.stats["max_latency_ms"], latency_ms)
+            result = None
+            try:
+                if not action.bulk_delete:
+                    self.stats["api_calls"] += 1
+                result = await action.run()
+                self.stats["executed"] += 1
+            except asyncio.CancelledError:
+                action.future.cancel()
+                raise
+            except Exception as e:
+                self.stats["failed"] += 1
+                print(f"❌ Moderation action failed: {e}")
+            finally:
+                if not action.future.done():
+                    action.future.set_result(result)
+                self.queue.task_done()
+
+    def status(self):
+        executed = self.stats["executed"] + self.stats["failed"]
+        return {
+            "workers": self.workers,
+            "depth": sum(self.depth.values()),
+            "depth_by_priority": {PRIORITY_NAMES[p]: n for p, n in self.depth.items()},
+            "avg_latency_ms": self.stats["total_latency_ms"] / executed if executed else 0.0,
+            **self.stats,
+        }
@@ -0,0 +1,199 @@
+"""
+Delayed deletion of moderation notices.
+
+Warning and timeout notices are removed a little while after they're posted.
+Instead of one call_later per notice, every pending deletion sits in a single
+min-heap ordered by due time and one task sleeps until the earliest entry.
+Deletions that come due together are handed over per channel as one batch
+(so they can go out as one bulk delete). Pending entries are also kept in
+SQLite, so notices posted before a restart are still cleaned up after it;
+the database is written behind, in batches on a worker thread, so
+scheduling a notice never waits for disk.
+
+An entry is forgotten as soon as it is handed over; a delete that fails
+(message already gone, missing permissions) is not retried.
+"""
+import asyncio
+import heapq
+import os
+import sqlite3
+import threading
+import time
+
+# Deletions due within this many seconds of each other go out in the same batch
+BATCH_WINDOW = 1.0
+# Schedule changes are saved at most this often
+SAVE_INTERVAL = 1.0
+
+
+class NoticeScheduler:
+    def __init__(self, path, expire, batch_window=BATCH_WINDOW, save_interval=SAVE_INTERVAL, clock=time.time):
+        self.path = path
+        self.expire = expire  # (channel_id, [message_ids]) -> None, called once they come due
+        self.batch_window = batch_window
+        self.save_interval = save_interval
+        self.clock = clock  # Wall clock, so due times still mean the same thing after a restart
+        self.heap = []  # (due, channel_id, message_id)
+        self.pending = {}  # message_id -> due (entries on the heap with another due are stale)
+        self.wakeup = asyncio.Event()
+        self.worker = None
+
+        # Write-behind: message_id -> row to save, or None to delete it
+        self.unsaved = {}
+        self.unsaved_event = asyncio.Event()
+        self.saving = None  # The batch being written on the worker thread
+        self.saver = None
+
+        self.stats = {
+            "scheduled": 0,
+            "restored": 0,
+            "expired": 0,
+            "batches": 0,
+            "saves": 0,
+        }
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db_lock = threading.Lock()
+        with self.db_lock, self.db:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute(
+                """CREATE TABLE IF NOT EXISTS scheduled_deletions (
+                    message_id INTEGER PRIMARY KEY,
+                    channel_id INTEGER NOT NULL,
+                    due REAL NOT NULL
+                )"""
+            )
+
+    def load(self):
+        """Put the deletions left over from the last run back on the heap; returns how many"""
+        with self.db_lock:
+            rows = self.db.execute("SELECT due, channel_id, message_id FROM scheduled_deletions").fetchall()
+        for due, channel_id, message_id in rows:
+            self.heap.append((due, channel_id, message_id))
+            self.pending[message_id] = due
+        heapq.heapify(self.heap)
+        self.stats["restored"] += len(rows)
+        self.wakeup.set()
+        return len(rows)
+
+    def schedule(self, channel_id, message_id, delay):
+        """Delete `message_id` in `channel_id` after `delay` seconds (rescheduling replaces the old time)"""
+        due = self.clock() + delay
+        heapq.heappush(self.heap, (due, channel_id, message_id))
+        self.pending[message_id] = due
+        self.unsaved[message_id] = (message_id, channel_id, due)
+        self.unsaved_event.set()
+        self.stats["scheduled"] += 1
+        if self.heap[0][2] == message_id:
+            self.wakeup.set()  # New earliest entry, the worker is sleeping for too long
+
+    def __contains__(self, message_id):
+        return message_id in self.pending
+
+    def __len__(self):
+        return len(self.pending)
+
+    def start(self, wait=None):
+        """Start the worker; `wait` (async callable) is awaited first, e.g. until the bot is ready"""
+        if self.worker is None or self.worker.done():
+            self.worker = asyncio.create_task(self._run(wait))
+        if self.saver is None or self.saver.done():
+            self.saver = asyncio.create_task(self._save_loop())
+
+    async def close(self):
+        """Stop the workers; whatever is still pending stays in the database for the next start"""
+        for task in (self.worker, self.saver):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self.worker = self.saver = None
+        if self.saving is not None:
+            # Cancelling the saver doesn't stop its thread; let that batch land before closing
+            await self.saving
+            self.saving = None
+        changes, self.unsaved = self.unsaved, {}
+        if changes:
+            self._save(changes)
+        with self.db_lock:
+            self.db.close()
+
+    async def _save_loop(self):
+        while True:
+            await self.unsaved_event.wait()
+            await asyncio.sleep(self.save_interval)  # Let a burst of notices share one transaction
+            self.unsaved_event.clear()
+            changes, self.unsaved = self.unsaved, {}
+            self.saving = asyncio.create_task(asyncio.to_thread(self._save, changes))
+            await asyncio.shield(self.saving)
+
+    def _save(self, changes):
+        rows = [row for row in changes.values() if row is not None]
+        expired = [(message_id,) for message_id, row in changes.items() if row is None]
+        try:
+            with self.db_lock, self.db:
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO scheduled_deletions (message_id, channel_id, due) VALUES (?, ?, ?)",
+                    rows,
+                )
+                self.db.executemany("DELETE FROM scheduled_deletions WHERE message_id = ?", expired)
+        except sqlite3.Error as e:
+            print(f"❌ Error saving {len(changes)} scheduled notice deletion(s): {e}")
+            return
+        self.stats["saves"] += 1
+
+    async def _run(self, wait):
+        if wait is not None:
+            await wait()
+        while True:
+            self.wakeup.clear()
+            if not self.heap:
+                await self.wakeup.wait()
+                continue
+            delay = self.heap[0][0] - self.clock()
+            if delay > 0:
+                # Not wait_for: on Python 3.11 it swallows close()'s cancel if schedule() wakes us at the same time
+                waiter = asyncio.ensure_future(self.wakeup.wait())
+                try:
+                    await asyncio.wait({waiter}, timeout=delay)
+                finally:
+                    waiter.cancel()
+                continue
+            self._fire()
+
+    def _fire(self):
+        """Hand over everything due (within the batch window), one call per channel"""
+        cutoff = self.clock() + self.batch_window
+        batches = {}
+        while self.heap and self.heap[0][0] <= cutoff:
+            due, channel_id, message_id = heapq.heappop(self.heap)
+            if self.pending.get(message_id) != due:
+                continue  # Rescheduled, a later entry owns it now
+            del self.pending[message_id]
+            batches.setdefault(channel_id, []).append(message_id)
+
+        for message_ids in batches.values():
+            for message_id in message_ids:
+                self.unsaved[message_id] = None
+            self.stats["expired"] += len(message_ids)
+        if batches:
+            self.unsaved_event.set()
+        for channel_id, message_ids in batches.items():
+            self.stats["batches"] += 1
+            try:
+                self.expire(channel_id, message_ids)
+            except Exception as e:
+                print(f"❌ Error expiring {len(message_ids)} notice(s) in channel {channel_id}: {e}")
+
+    def status(self):
+        return {
+            "pending": len(self.pending),
+            "heap": len(self.heap),
+            "unsaved": len(self.unsaved),
+            "next_due_in": max(0.0, self.heap[0][0] - self.clock()) if self.heap else None,
+            **self.stats,
+        }
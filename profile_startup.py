@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Import-time profile and budget check for the bot's cold start.
+
+Imports main.py in a fresh interpreter with `-X importtime` and prints how the
+time splits across its direct imports. Exits non-zero when the total goes over
+the budget, so it can gate a deploy:
+
+    python profile_startup.py                  # breakdown, default budget
+    python profile_startup.py --budget-ms 800 --top 20
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def measure_imports(module="main"):
+    """Return (total_us, [(cumulative_us, self_us, name)]) for the module's direct imports"""
+    # Importing main has no side effects (stores open in setup_hook), so it can run in place
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=HERE,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{result.stderr.strip()}")
+
+    total = 0
+    children = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        name = name.strip()
+        if name == module and depth == 0:
+            total = int(cumulative_us)
+        elif depth == 1:
+            children.append((int(cumulative_us), int(self_us), name))
+        elif depth == 0:
+            # Imported by the interpreter before main (site, encodings, ...)
+            children.append((int(cumulative_us), int(self_us), f"{name} (interpreter)"))
+    children.sort(reverse=True)
+    return total, children
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start import profile for main.py")
+    parser.add_argument("--budget-ms", type=float, default=1500, help="fail if importing main takes longer")
+    parser.add_argument("--runs", type=int, default=3, help="take the fastest of N cold imports")
+    parser.add_argument("--top", type=int, default=15, help="how many imports to list")
+    args = parser.parse_args()
+
+    runs = [measure_imports() for _ in range(max(1, args.runs))]
+    total, children = min(runs, key=lambda run: run[0])
+    total_ms = total / 1000
+
+    print(f"{'import':<40}{'cumulative ms':>15}{'self ms':>10}")
+    print("-" * 65)
+    for cumulative_us, self_us, name in children[:args.top]:
+        print(f"{name:<40}{cumulative_us / 1000:>15.1f}{self_us / 1000:>10.1f}")
+    print("-" * 65)
+    print(f"{'import main (best of ' + str(len(runs)) + ')':<40}{total_ms:>15.1f}")
+
+    if total_ms > args.budget_ms:
+        print(f"❌ Cold import took {total_ms:.0f} ms, over the {args.budget_ms:.0f} ms budget")
+        sys.exit(1)
+    print(f"✅ Cold import within the {args.budget_ms:.0f} ms budget")
+
+
+if __name__ == "__main__":
+    main()
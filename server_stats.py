@@ -0,0 +1,284 @@
+"""
+Server stats bookkeeping shared by the stats channel updater.
+
+MemberCounter keeps per-guild total/human/bot counts. They are computed once
+(from the member cache, or by count_members when the cache is incomplete) and
+then adjusted in O(1) on join/leave, with an occasional reconciliation pass to
+correct any drift.
+
+StatsScheduler coalesces join/leave events into rate-limit-aware flushes of
+the stats channels, and StatsChannelStore remembers which category and
+channels hold each guild's stats so they resolve by ID instead of by name.
+"""
+import asyncio
+import json
+import os
+import random
+import time
+import zlib
+
+
+class MemberCounter:
+    def __init__(self):
+        self.counts = {}  # guild_id -> {"total": int, "humans": int, "bots": int}
+        self.stats = {
+            "recounts": 0,
+            "drift_corrections": 0,
+        }
+
+    def recount(self, guild):
+        """Full O(members) count from the member cache; returns how far the tracked counts had drifted"""
+        return self.update(guild.id, cached_counts(guild))
+
+    def update(self, guild_id, fresh):
+        """Replace a guild's counts (e.g. from count_members); returns the drift"""
+        old = self.counts.get(guild_id)
+        self.counts[guild_id] = fresh
+        self.stats["recounts"] += 1
+
+        drift = 0
+        if old is not None:
+            drift = sum(abs(fresh[k] - old[k]) for k in fresh)
+            if drift:
+                self.stats["drift_corrections"] += 1
+        return drift
+
+    def member_joined(self, member):
+        counts = self.counts.get(member.guild.id)
+        if counts is None:
+            return  # Not tracked yet; the first count will include this member
+        counts["total"] += 1
+        counts["bots" if member.bot else "humans"] += 1
+
+    def member_left(self, guild_id, user):
+        counts = self.counts.get(guild_id)
+        if counts is None:
+            return
+        counts["total"] = max(0, counts["total"] - 1)
+        key = "bots" if user.bot else "humans"
+        counts[key] = max(0, counts[key] - 1)
+
+    def forget(self, guild):
+        self.counts.pop(guild.id, None)
+
+
+def cached_counts(guild):
+    """Counts from the member cache (only accurate when the guild is chunked)"""
+    bots = sum(1 for m in guild.members if m.bot)
+    return {
+        "total": guild.member_count or len(guild.members),
+        "humans": len(guild.members) - bots,
+        "bots": bots,
+    }
+
+
+async def count_members(guild, chunk=True):
+    """
+    Count a guild's members without needing them all cached up front.
+
+    A chunked guild is counted from the cache. Otherwise the guild is either
+    chunked on demand (`chunk=True`, the members stay cached) or its member
+    list is streamed page by page over REST and counted without caching.
+    """
+    if guild.chunked:
+        return cached_counts(guild)
+    if chunk:
+        await guild.chunk(cache=True)
+        return cached_counts(guild)
+
+    seen = bots = 0
+    async for member in guild.fetch_members(limit=None):
+        seen += 1
+        bots += member.bot
+    return {
+        "total": guild.member_count or seen,
+        "humans": seen - bots,
+        "bots": bots,
+    }
+
+
+class StatsScheduler:
+    """
+    Per-guild dirty-flag scheduler for stats channel renames.
+
+    Events only mark a guild dirty. A single worker flushes each dirty guild at
+    most once per `min_interval` seconds (Discord allows very few channel renames
+    per window) and always publishes the latest counts at flush time, so the
+    last join of a burst is never lost.
+    """
+
+    def __init__(self, flush, min_interval=300.0, max_concurrency=4):
+        self.flush = flush  # async (guild_id)
+        self.min_interval = min_interval
+        self.dirty = set()
+        self.in_flight = {}  # guild_id -> flush task
+        self.last_flush = {}  # guild_id -> monotonic time of the last flush
+        self.published = {}  # guild_id -> counts last written to the channels
+        self.semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        self.wakeup = asyncio.Event()
+        self.worker = None
+
+        self.stats = {
+            "marks": 0,
+            "coalesced": 0,
+            "flushes": 0,
+            "renames_performed": 0,
+            "renames_skipped": 0,
+            "api_calls": 0,
+        }
+
+    def start(self):
+        if self.worker is None or self.worker.done():
+            self.worker = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self.worker is not None:
+            self.worker.cancel()
+            try:
+                await self.worker
+            except asyncio.CancelledError:
+                pass
+            self.worker = None
+
+    def mark_dirty(self, guild_id):
+        self.stats["marks"] += 1
+        if guild_id in self.dirty:
+            self.stats["coalesced"] += 1
+            return
+        self.dirty.add(guild_id)
+        self.wakeup.set()
+
+    def forget(self, guild_id):
+        self.dirty.discard(guild_id)
+        self.last_flush.pop(guild_id, None)
+        self.published.pop(guild_id, None)
+
+    def changed(self, guild_id, counts):
+        """True if `counts` differ from what the stats channels currently show"""
+        return self.published.get(guild_id) != counts
+
+    async def _run(self):
+        while True:
+            # Clear before scanning so a mark made during a flush wakes us again
+            self.wakeup.clear()
+            next_due = None
+
+            for guild_id in list(self.dirty):
+                if guild_id in self.in_flight:
+                    continue  # Re-checked once the running flush finishes
+                due = self.last_flush.get(guild_id, float("-inf")) + self.min_interval
+                if due > time.monotonic():
+                    next_due = due if next_due is None else min(next_due, due)
+                    continue
+
+                self.dirty.discard(guild_id)
+                self.last_flush[guild_id] = time.monotonic()
+                self.in_flight[guild_id] = asyncio.create_task(self._flush(guild_id))
+
+            timeout = None if next_due is None else max(0.0, next_due - time.monotonic())
+            # Not wait_for: on Python 3.11 it swallows close()'s cancel if mark_dirty() wakes us at the same time
+            waiter = asyncio.ensure_future(self.wakeup.wait())
+            try:
+                await asyncio.wait({waiter}, timeout=timeout)
+            finally:
+                waiter.cancel()
+
+    async def _flush(self, guild_id):
+        try:
+            async with self.semaphore:
+                self.stats["flushes"] += 1
+                await self.flush(guild_id)
+        except Exception as e:
+            print(f"❌ Error flushing server stats for guild {guild_id}: {e}")
+        finally:
+            self.in_flight.pop(guild_id, None)
+            self.wakeup.set()
+
+    def status(self):
+        return {
+            "dirty": len(self.dirty),
+            "in_flight": len(self.in_flight),
+            "min_interval": self.min_interval,
+            **self.stats,
+        }
+
+
+class StatsChannelStore:
+    """
+    Small JSON store of stats category/channel IDs per guild.
+
+    Lookups are O(1) dict reads; the file is only rewritten when an entry is
+    created or repaired. `lock(guild_id)` serializes channel creation per
+    guild so concurrent updates can never create duplicates.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.guilds = {}  # guild_id -> {"category": id, "All Members": id, ...}
+        self.locks = {}
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+            self.guilds = {int(guild_id): ids for guild_id, ids in raw.items()}
+        except FileNotFoundError:
+            self.guilds = {}
+        except (OSError, ValueError) as e:
+            print(f"⚠️  Could not read stats channel store {self.path}: {e}")
+            self.guilds = {}
+
+    def save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({str(guild_id): ids for guild_id, ids in self.guilds.items()}, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"⚠️  Could not write stats channel store {self.path}: {e}")
+
+    def lock(self, guild_id):
+        lock = self.locks.get(guild_id)
+        if lock is None:
+            lock = self.locks[guild_id] = asyncio.Lock()
+        return lock
+
+    def get(self, guild_id, name):
+        return self.guilds.get(guild_id, {}).get(name)
+
+    def set(self, guild_id, name, channel_id):
+        ids = self.guilds.setdefault(guild_id, {})
+        if ids.get(name) != channel_id:
+            ids[name] = channel_id
+            self.save()
+
+    def discard_channel(self, guild_id, channel_id):
+        """Drop a deleted channel from the store; returns True if it was a stats channel"""
+        ids = self.guilds.get(guild_id)
+        if not ids:
+            return False
+        names = [name for name, stored_id in ids.items() if stored_id == channel_id]
+        for name in names:
+            del ids[name]
+        if names:
+            self.save()
+        return bool(names)
+
+    def forget(self, guild_id):
+        if self.guilds.pop(guild_id, None) is not None:
+            self.save()
+        self.locks.pop(guild_id, None)
+
+
+def slot_delay(guild_id, spread, slots=60):
+    """
+    Seconds to wait before refreshing a guild within a refresh cycle.
+
+    Guilds are hashed into `slots` fixed time slots across `spread` seconds, with
+    jitter inside the slot, so a cycle's REST calls don't all land at once.
+    """
+    slot_length = spread / slots
+    slot = zlib.crc32(str(guild_id).encode()) % slots
+    return slot * slot_length + random.uniform(0, slot_length)
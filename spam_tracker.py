@@ -0,0 +1,243 @@
+"""
+Per-user message rate tracking for spam detection.
+
+Timestamps come from the monotonic clock, so wall-clock adjustments can't
+make a burst look older or newer than it is. Two modes:
+
+- "window": sliding window of message times per key. Each hit appends one
+  timestamp and drops the expired ones from the front, which is amortized
+  O(1). The window holds every message inside the timeframe, so any
+  threshold works.
+- "bucket": token bucket per key. A burst of `threshold - 1` messages is
+  free, and spent tokens refill evenly over `timeframe`, so tolerance comes
+  back gradually instead of all at once when old messages leave the window.
+
+None of the structures keep anything for users who go quiet: `sweep(idle)`
+drops keys with no message for `idle` seconds, and WarningCounter entries
+decay away on their own. RecentMessages remembers the last few message IDs
+per user and channel so spam can be deleted without a history fetch.
+"""
+import sys
+import time
+from collections import deque
+
+MODES = ("window", "bucket")
+
+FLOAT_BYTES = sys.getsizeof(0.0)
+# One (message_id, monotonic time) ring buffer entry
+MESSAGE_ENTRY_BYTES = sys.getsizeof((0, 0.0)) + sys.getsizeof(1 << 60) + FLOAT_BYTES
+
+
+def key_bytes(key):
+    """Approximate size of a (guild_id, user_id) style key"""
+    if isinstance(key, tuple):
+        return sys.getsizeof(key) + sum(sys.getsizeof(part) for part in key)
+    return sys.getsizeof(key)
+
+
+class SpamTracker:
+    def __init__(self, mode="window", clock=time.monotonic):
+        if mode not in MODES:
+            raise ValueError(f"Unknown spam tracking mode: {mode}")
+        self.mode = mode
+        self.clock = clock
+        self.windows = {}  # key -> deque of monotonic message times (window mode)
+        self.buckets = {}  # key -> [tokens, last refill time] (bucket mode)
+
+    def hit(self, key, threshold, timeframe):
+        """Record a message for `key`; True once it reaches `threshold` messages per `timeframe` seconds"""
+        now = self.clock()
+        if self.mode == "bucket":
+            return not self._take_token(key, threshold, timeframe, now)
+        return self._count(key, timeframe, now) >= threshold
+
+    def _count(self, key, timeframe, now):
+        window = self.windows.get(key)
+        if window is None:
+            window = self.windows[key] = deque()
+        window.append(now)
+        cutoff = now - timeframe
+        while window[0] < cutoff:
+            window.popleft()
+        return len(window)
+
+    def _take_token(self, key, threshold, timeframe, now):
+        capacity = max(1, threshold - 1)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = [float(capacity), now]
+        else:
+            refill = (now - bucket[1]) * capacity / timeframe
+            bucket[0] = min(capacity, bucket[0] + refill)
+            bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return True
+        return False
+
+    def forget(self, key):
+        self.windows.pop(key, None)
+        self.buckets.pop(key, None)
+
+    def __contains__(self, key):
+        return key in self.windows or key in self.buckets
+
+    def sweep(self, idle):
+        """Drop keys idle for `idle` seconds (keep it above the longest timeframe); returns how many"""
+        cutoff = self.clock() - idle
+        stale = [key for key, window in self.windows.items() if window[-1] < cutoff]
+        stale += [key for key, bucket in self.buckets.items() if bucket[1] < cutoff]
+        for key in stale:
+            self.forget(key)
+        return len(stale)
+
+    def status(self):
+        size = sys.getsizeof(self.windows) + sys.getsizeof(self.buckets)
+        for key, window in self.windows.items():
+            size += key_bytes(key) + sys.getsizeof(window) + len(window) * FLOAT_BYTES
+        for key, bucket in self.buckets.items():
+            size += key_bytes(key) + sys.getsizeof(bucket) + 2 * FLOAT_BYTES
+        return {
+            "mode": self.mode,
+            "tracked": len(self.windows) + len(self.buckets),
+            "timestamps": sum(len(window) for window in self.windows.values()),
+            "bytes": size,
+        }
+
+
+class WarningCounter:
+    """
+    Warning counts that decay by one for every `decay` seconds without a new warning.
+
+    Decay is applied lazily on access; an entry that has decayed to zero is
+    removed, so users who behave leave nothing behind.
+    """
+
+    def __init__(self, decay, clock=time.monotonic):
+        self.decay = decay
+        self.clock = clock
+        self.entries = {}  # key -> [count, monotonic time the count was last decayed/raised]
+
+    def _current(self, key, now):
+        entry = self.entries.get(key)
+        if entry is None:
+            return 0
+        steps = int((now - entry[1]) // self.decay) if self.decay > 0 else 0
+        if steps:
+            entry[0] -= steps
+            entry[1] += steps * self.decay
+            if entry[0] <= 0:
+                del self.entries[key]
+                return 0
+        return entry[0]
+
+    def get(self, key):
+        return self._current(key, self.clock())
+
+    def add(self, key):
+        """Record a warning; returns the new (decayed) count"""
+        now = self.clock()
+        count = self._current(key, now) + 1
+        self.entries[key] = [count, now]
+        return count
+
+    def reset(self, key):
+        self.entries.pop(key, None)
+
+    def restore(self, key, count, age):
+        """Load a count last raised `age` seconds ago (e.g. from the infraction ledger), decaying it to now"""
+        if count > 0:
+            now = self.clock()
+            self.entries[key] = [count, now - max(0.0, age)]
+            self._current(key, now)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def sweep(self):
+        """Drop entries that have fully decayed; returns how many"""
+        now = self.clock()
+        before = len(self.entries)
+        for key in list(self.entries):
+            self._current(key, now)
+        return before - len(self.entries)
+
+    def status(self):
+        size = sys.getsizeof(self.entries)
+        for key, entry in self.entries.items():
+            size += key_bytes(key) + sys.getsizeof(entry) + FLOAT_BYTES
+        return {"tracked": len(self.entries), "bytes": size}
+
+
+class RecentMessages:
+    """
+    Ring buffer of recent message IDs per (guild_id, channel_id, user_id).
+
+    Filled as messages arrive, so a spam burst can be deleted by ID without
+    fetching channel history. Each buffer holds at most `size` messages and
+    is dropped by `sweep(idle)` once its newest message is `idle` seconds old.
+
+    `covers(key, within)` says whether the buffer holds every (not yet
+    deleted) message of the last `within` seconds. That only fails right
+    after startup, when messages from before it were never seen, or after
+    the buffer overflowed and dropped messages that are still that recent.
+    """
+
+    def __init__(self, size=20, clock=time.monotonic):
+        self.size = size
+        self.clock = clock
+        self.started = clock()  # Nothing from before this was recorded
+        self.buffers = {}  # key -> deque of (message_id, monotonic time); emptied buffers stay until swept
+        self.overflowed = {}  # key -> time of the newest message the full buffer dropped
+
+    def add(self, key, message_id):
+        buffer = self.buffers.get(key)
+        if buffer is None:
+            buffer = self.buffers[key] = deque(maxlen=self.size)
+        elif len(buffer) == self.size:
+            self.overflowed[key] = buffer[0][1]
+        buffer.append((message_id, self.clock()))
+
+    def covers(self, key, within):
+        """True if every message from `key` in the last `within` seconds is (or was, until deleted) buffered"""
+        cutoff = self.clock() - within
+        return self.overflowed.get(key, self.started) < cutoff
+
+    def recent(self, key, within):
+        """IDs of the messages seen in the last `within` seconds, oldest first"""
+        buffer = self.buffers.get(key)
+        if not buffer:
+            return []
+        cutoff = self.clock() - within
+        return [message_id for message_id, seen in buffer if seen >= cutoff]
+
+    def discard(self, key, message_ids):
+        buffer = self.buffers.get(key)
+        if not buffer:
+            return
+        message_ids = set(message_ids)
+        # Kept even when empty: the buffer still covers everything since it started (or overflowed)
+        self.buffers[key] = deque((entry for entry in buffer if entry[0] not in message_ids), maxlen=self.size)
+
+    def sweep(self, idle):
+        cutoff = self.clock() - idle
+        # An emptied buffer means everything it saw was deleted, so dropping it loses no coverage
+        # (unless it overflowed recently: the messages it dropped were never deleted)
+        stale = [
+            key for key, buffer in self.buffers.items()
+            if (buffer[-1][1] if buffer else self.overflowed.get(key, cutoff - 1)) < cutoff
+        ]
+        for key in stale:
+            del self.buffers[key]
+            self.overflowed.pop(key, None)
+        return len(stale)
+
+    def status(self):
+        size = sys.getsizeof(self.buffers)
+        for key, buffer in self.buffers.items():
+            size += key_bytes(key) + sys.getsizeof(buffer) + len(buffer) * MESSAGE_ENTRY_BYTES
+        return {
+            "buffers": len(self.buffers),
+            "message_ids": sum(len(buffer) for buffer in self.buffers.values()),
+            "bytes": size,
+        }
@@ -0,0 +1,447 @@
+"""
+Welcome card rendering pipeline.
+
+Avatar downloads go through a pooled aiohttp session and all PIL work runs in
+a bounded worker pool, so a join burst never stalls the gateway heartbeat.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from io import BytesIO
+
+import aiohttp
+
+# PIL is imported inside the functions that use it: it is only needed once the
+# first card is rendered, and the pool warm-up pulls it in off the main thread.
+
+# Everything the worker needs to draw a card (must stay picklable for process pools)
+CardLayout = namedtuple("CardLayout", [
+    "background_path",
+    "font_path",
+    "avatar_size",
+    "avatar_position",
+    "text",
+    "text_position",
+    "text_font_size",
+    "text_color",
+    # Output encoding: "png", "png-quantized" or "webp"
+    "encoding",
+    "quality",          # WebP quality (1-100)
+    "compress_level",   # PNG zlib level (0-9)
+    "target_width",     # Downscale the card to this width (0 keeps full size)
+    "max_bytes",        # Fall back to cheaper encodings until the card fits (0 disables)
+], defaults=("png", 80, 6, 0, 0))
+
+ENCODINGS = ("png", "png-quantized", "webp")
+
+
+class RenderQueueFull(Exception):
+    """Raised when too many welcome cards are already waiting for a worker"""
+
+
+class WelcomeTemplate:
+    """Decoded background, avatar mask and font, built once and shared by every render"""
+
+    def __init__(self, layout):
+        from PIL import Image, ImageDraw, ImageFont
+
+        started = time.perf_counter()
+        self.key = template_key(layout)
+        # Asset mtimes double as the template version for cache keys
+        self.version = asset_version(layout)
+
+        with Image.open(layout.background_path) as background:
+            self.background = background.convert("RGBA")
+        self.background.load()
+
+        # Draw the circle at 4x and downsample so the avatar edge is antialiased
+        width, height = layout.avatar_size
+        big_mask = Image.new("L", (width * 4, height * 4), 0)
+        ImageDraw.Draw(big_mask).ellipse((0, 0, width * 4, height * 4), fill=255)
+        self.mask = big_mask.resize(layout.avatar_size, Image.LANCZOS)
+
+        try:
+            self.font = ImageFont.truetype(layout.font_path, layout.text_font_size)
+        except Exception:
+            self.font = ImageFont.load_default()
+
+        self.load_ms = (time.perf_counter() - started) * 1000
+
+
+_templates = {}
+_templates_lock = threading.Lock()
+
+
+def template_key(layout):
+    return (layout.background_path, layout.font_path, layout.avatar_size, layout.text_font_size)
+
+
+def asset_version(layout):
+    """Version of the template assets: (background mtime, font mtime or 0)"""
+    try:
+        font_mtime = os.stat(layout.font_path).st_mtime_ns
+    except OSError:
+        font_mtime = 0  # Missing font falls back to PIL's default font
+    return (os.stat(layout.background_path).st_mtime_ns, font_mtime)
+
+
+def get_template(layout):
+    """Return the cached template for this layout, reloading only if an asset changed"""
+    key = template_key(layout)
+    version = asset_version(layout)
+    template = _templates.get(key)
+    if template is not None and template.version == version:
+        return template
+
+    with _templates_lock:
+        template = _templates.get(key)
+        if template is None or template.version != version:
+            template = WelcomeTemplate(layout)
+            _templates[key] = template
+            print(f"🖼️ Loaded welcome template {layout.background_path} in {template.load_ms:.1f} ms")
+        return template
+
+
+def warm_template(layout):
+    """Load the template in a worker and return its version (cheap to pickle back)"""
+    return get_template(layout).version
+
+
+def _report_warmup(future):
+    if not future.cancelled() and future.exception() is not None:
+        print(f"⚠️  Welcome template warm-up failed: {future.exception()}")
+
+
+def render_card(avatar_bytes, layout, resized=False):
+    """
+    Blocking PIL work: decode the avatar, mask it and paste it onto the background.
+
+    Returns (encoded card bytes, resized avatar PNG bytes). When `resized` is True the
+    avatar came from the cache already at layout.avatar_size and is returned as-is.
+    """
+    from PIL import Image, ImageDraw
+
+    template = get_template(layout)
+
+    avatar = Image.open(BytesIO(avatar_bytes)).convert("RGBA")
+    if resized and avatar.size == layout.avatar_size:
+        resized_bytes = avatar_bytes
+    else:
+        avatar = avatar.resize(layout.avatar_size)
+        avatar_buffer = BytesIO()
+        avatar.save(avatar_buffer, format="PNG", compress_level=1)
+        resized_bytes = avatar_buffer.getvalue()
+    avatar.putalpha(template.mask)
+
+    bg = template.background.copy()
+    bg.paste(avatar, layout.avatar_position, avatar)
+
+    if layout.text:
+        draw = ImageDraw.Draw(bg)
+        draw.text(layout.text_position, layout.text, font=template.font, fill=layout.text_color)
+
+    return encode_card(bg, layout), resized_bytes
+
+
+def encode_image(img, encoding, quality=80, compress_level=6):
+    """Encode a card image in one of ENCODINGS and return the bytes"""
+    from PIL import Image
+
+    buffer = BytesIO()
+    if encoding == "png":
+        img.save(buffer, format="PNG", compress_level=compress_level)
+    elif encoding == "png-quantized":
+        # 256-colour palette: much smaller PNG for a small quantize cost
+        palette = img.convert("RGB").quantize(colors=256, method=Image.Quantize.FASTOCTREE)
+        palette.save(buffer, format="PNG", compress_level=compress_level)
+    elif encoding == "webp":
+        img.save(buffer, format="WEBP", quality=quality, method=4)
+    else:
+        raise ValueError(f"Unknown welcome card encoding: {encoding}")
+    return buffer.getvalue()
+
+
+def downscale(img, width):
+    if not width or img.width <= width:
+        return img
+    from PIL import Image
+
+    height = round(img.height * width / img.width)
+    return img.resize((width, height), Image.LANCZOS)
+
+
+def encode_card(img, layout):
+    """
+    Encode the finished card according to the layout's output settings.
+
+    With a byte budget, the configured encoding is tried first and then
+    progressively cheaper-to-upload options (quantized PNG, lower WebP
+    qualities, half width) until one fits; the smallest result wins otherwise.
+    """
+    img = downscale(img, layout.target_width)
+    data = encode_image(img, layout.encoding, layout.quality, layout.compress_level)
+    if not layout.max_bytes or len(data) <= layout.max_bytes:
+        return data
+
+    # (width divisor, encoding, quality); the half-width copy is only made if that fallback is reached
+    fallbacks = [
+        (1, "png-quantized", layout.quality),
+        (1, "webp", layout.quality),
+        (1, "webp", min(layout.quality, 60)),
+        (1, "webp", min(layout.quality, 40)),
+        (2, "webp", min(layout.quality, 60)),
+    ]
+    smallest = data
+    for divisor, encoding, quality in fallbacks:
+        if encoding == layout.encoding and quality == layout.quality and divisor == 1:
+            continue  # Already tried above
+        candidate = img if divisor == 1 else downscale(img, img.width // divisor)
+        data = encode_image(candidate, encoding, quality, layout.compress_level)
+        if len(data) <= layout.max_bytes:
+            return data
+        if len(data) < len(smallest):
+            smallest = data
+    return smallest
+
+
+def card_filename(data):
+    """Attachment filename matching the encoded card's format"""
+    return "welcome.webp" if bytes(data[:4]) == b"RIFF" else "welcome.png"
+
+
+class CardCache:
+    """
+    Memoized encoded cards keyed by (avatar hash, template version, layout).
+
+    Bounded by total bytes with LRU eviction. The layout is part of the key, so
+    changing the text constants in main.py never serves a stale card, and a new
+    template version drops everything rendered from the old assets.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> card bytes
+        self.total_bytes = 0
+        self.versions = {}  # template key -> asset version the cached cards were built from
+
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "invalidations": 0,
+        }
+
+    def get(self, avatar_hash, version, layout):
+        template = template_key(layout)
+        if self.versions.get(template) != version:
+            self.invalidate(template, version)
+        key = (avatar_hash, version, layout)
+        card = self.entries.get(key)
+        if card is None:
+            self.stats["misses"] += 1
+            return None
+        self.entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return card
+
+    def put(self, avatar_hash, version, layout, card):
+        if len(card) > self.max_bytes or self.versions.get(template_key(layout)) != version:
+            return
+        key = (avatar_hash, version, layout)
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.total_bytes -= len(old)
+        self.entries[key] = card
+        self.total_bytes += len(card)
+
+        while self.total_bytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.total_bytes -= len(evicted)
+            self.stats["evictions"] += 1
+
+    def invalidate(self, template, version=None):
+        """Drop every card built from an older version of this template"""
+        stale = [key for key in self.entries if template_key(key[2]) == template]
+        for key in stale:
+            self.total_bytes -= len(self.entries.pop(key))
+        if stale:
+            self.stats["invalidations"] += 1
+        self.versions[template] = version
+
+    def status(self):
+        return {
+            "items": len(self.entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            **self.stats,
+        }
+
+
+class WelcomeRenderer:
+    """Async front-end for welcome card rendering with a bounded worker pool"""
+
+    def __init__(self, layout, workers=2, max_pending=16, timeout=10.0, use_processes=False,
+                 avatar_cache=None, card_cache=None):
+        self.layout = layout
+        self.avatar_cache = avatar_cache
+        self.card_cache = card_cache
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self.timeout = timeout
+        self.use_processes = use_processes
+
+        self.session = None
+        self.executor = None
+        self.warmup = None
+        self.prune_task = None
+        self.pending = 0  # Renders submitted to the pool and not finished yet
+        self.last_render_ms = 0.0
+        self.total_render_ms = 0.0
+
+        self.stats = {
+            "rendered": 0,
+            "rejected": 0,
+            "timeouts": 0,
+            "failed": 0,
+        }
+
+    async def start(self):
+        """Create the HTTP session and worker pool (must run inside the event loop)"""
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.workers * 2, ttl_dns_cache=300)
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        if self.executor is None:
+            pool_cls = ProcessPoolExecutor if self.use_processes else ThreadPoolExecutor
+            self.executor = pool_cls(max_workers=self.workers)
+            # Import PIL and decode the template in the background so startup isn't
+            # held up; a render that arrives first simply queues behind the warm-up
+            self.warmup = self.executor.submit(warm_template, self.layout)
+            self.warmup.add_done_callback(_report_warmup)
+            if self.avatar_cache is not None:
+                self.prune_task = asyncio.create_task(self._prune_avatar_cache())
+
+    async def _prune_avatar_cache(self):
+        removed = await asyncio.to_thread(self.avatar_cache.prune)
+        if removed:
+            print(f"🗑️ Pruned {removed} expired avatar cache entries")
+
+    async def close(self):
+        """Release the HTTP session and worker pool"""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    async def fetch_avatar(self, url):
+        """Download avatar bytes through the shared session"""
+        async with self.session.get(str(url)) as response:
+            response.raise_for_status()
+            return await response.read()
+
+    async def render(self, avatar_url, avatar_hash=None, layout=None):
+        """
+        Render the card for an avatar; returns a BytesIO with the encoded card.
+
+        With an avatar hash the resized avatar is looked up in (and stored to)
+        the avatar cache, so repeat joins skip the download and resize, and the
+        finished card is memoized so an identical render skips PIL entirely.
+        `layout` overrides the default layout (e.g. a guild's chosen template).
+        """
+        layout = layout or self.layout
+        version = None
+        if self.card_cache is not None and avatar_hash:
+            # A stat per join is far cheaper than any render and catches asset edits
+            version = asset_version(layout)
+            card = self.card_cache.get(avatar_hash, version, layout)
+            if card is not None:
+                return BytesIO(card)
+
+        if self.pending >= self.max_pending:
+            self.stats["rejected"] += 1
+            raise RenderQueueFull(f"{self.pending} welcome cards already pending")
+
+        # A slot is held from admission until the pool job really finishes,
+        # so timed-out jobs still count against the queue depth
+        slot = {"released": False}
+        self.pending += 1
+        try:
+            card = await asyncio.wait_for(self._render(avatar_url, avatar_hash, layout, slot), self.timeout)
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            raise
+        except Exception:
+            self.stats["failed"] += 1
+            raise
+        finally:
+            if not slot.get("submitted"):
+                self._release(slot)
+
+        if version is not None:
+            self.card_cache.put(avatar_hash, version, layout, card)
+        return BytesIO(card)
+
+    async def _render(self, avatar_url, avatar_hash, layout, slot):
+        await self.start()
+
+        cache_key = None
+        cached = None
+        if self.avatar_cache is not None and avatar_hash:
+            cache_key = self.avatar_cache.make_key(avatar_hash, layout.avatar_size)
+            cached = await self.avatar_cache.get(cache_key)
+
+        avatar_bytes = cached if cached is not None else await self.fetch_avatar(avatar_url)
+        card, resized = await self.run_in_pool(
+            slot, render_card, avatar_bytes, layout, cached is not None
+        )
+        if cache_key and cached is None:
+            await self.avatar_cache.put(cache_key, resized)
+
+        self.stats["rendered"] += 1
+        return card
+
+    async def run_in_pool(self, slot, fn, *args):
+        """Submit blocking work to the pool; the slot is released when the job ends"""
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+
+        def _done(_):
+            # Runs on a worker thread; hop back to the loop to touch shared state
+            try:
+                loop.call_soon_threadsafe(self._release, slot, started)
+            except RuntimeError:
+                pass  # Loop already closed during shutdown
+
+        future = self.executor.submit(fn, *args)
+        slot["submitted"] = True
+        future.add_done_callback(_done)
+        # Cancelling the wrapper (e.g. on timeout) also drops the job if it hasn't started
+        return await asyncio.wrap_future(future)
+
+    def _release(self, slot, started=None):
+        if slot["released"]:
+            return
+        slot["released"] = True
+        self.pending -= 1
+        if started is not None:
+            self.last_render_ms = (time.perf_counter() - started) * 1000
+            self.total_render_ms += self.last_render_ms
+
+    def status(self):
+        """Snapshot of pool and counter state for debug commands"""
+        return {
+            "pool": "process" if self.use_processes else "thread",
+            "workers": self.workers,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "last_render_ms": self.last_render_ms,
+            "avg_render_ms": self.total_render_ms / self.stats["rendered"] if self.stats["rendered"] else 0.0,
+            **self.stats,
+        }
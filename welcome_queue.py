@@ -0,0 +1,115 @@
+"""
+Join-burst coalescing for welcome messages.
+
+Joins are queued and collected for a short window. A lone join gets the normal
+welcome card; a burst in the same channel becomes one embed listing the new
+members, so raids and invite campaigns don't run into the send rate limit.
+"""
+import asyncio
+
+
+class WelcomeQueue:
+    def __init__(self, send_single, send_batch, window=2.0, max_batch=20, max_size=1000):
+        self.send_single = send_single  # async (member, channel)
+        self.send_batch = send_batch    # async (members, channel)
+        self.window = window
+        self.max_batch = max(2, max_batch)
+        self.queue = asyncio.Queue(maxsize=max_size)
+        self.worker = None
+
+        self.stats = {
+            "enqueued": 0,
+            "dropped": 0,
+            "duplicates": 0,
+            "single_sends": 0,
+            "batch_sends": 0,
+            "batched_members": 0,
+        }
+
+    def start(self):
+        if self.worker is None or self.worker.done():
+            self.worker = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self.worker is not None:
+            self.worker.cancel()
+            try:
+                await self.worker
+            except asyncio.CancelledError:
+                pass
+            self.worker = None
+
+    def enqueue(self, member, channel):
+        """Queue a welcome; returns False if the queue is full and the join was dropped"""
+        try:
+            self.queue.put_nowait((member, channel))
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+            print(f"⚠️  Welcome queue full, dropped welcome for {member.name}")
+            return False
+        self.stats["enqueued"] += 1
+        return True
+
+    async def _collect(self):
+        """Wait for the first join, then gather everything arriving within the window"""
+        batch = [await self.queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.window
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            # Not wait_for: on Python 3.11 it swallows close()'s cancel if a join arrives at the same time
+            getter = asyncio.ensure_future(self.queue.get())
+            try:
+                await asyncio.wait({getter}, timeout=remaining)
+            finally:
+                timed_out = not getter.done()
+                if timed_out:
+                    getter.cancel()
+            if timed_out:
+                break
+            batch.append(getter.result())
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+
+            # Group by channel and keep one entry per member (join/leave/rejoin in a burst)
+            by_channel = {}
+            seen = set()
+            for member, channel in batch:
+                key = (member.guild.id, member.id)
+                if key in seen:
+                    self.stats["duplicates"] += 1
+                    continue
+                seen.add(key)
+                by_channel.setdefault(channel.id, (channel, []))[1].append(member)
+
+            for channel, members in by_channel.values():
+                for i in range(0, len(members), self.max_batch):
+                    chunk = members[i:i + self.max_batch]
+                    try:
+                        if len(chunk) == 1:
+                            await self.send_single(chunk[0], channel)
+                            self.stats["single_sends"] += 1
+                        else:
+                            await self.send_batch(chunk, channel)
+                            self.stats["batch_sends"] += 1
+                            self.stats["batched_members"] += len(chunk)
+                    except Exception as e:
+                        print(f"❌ Error sending queued welcome in {channel.name}: {e}")
+
+            for _ in batch:
+                self.queue.task_done()
+
+    def status(self):
+        offered = self.stats["enqueued"] + self.stats["dropped"]
+        return {
+            "depth": self.queue.qsize(),
+            "max_size": self.queue.maxsize,
+            "window": self.window,
+            "drop_rate": self.stats["dropped"] / offered if offered else 0.0,
+            **self.stats,
+        }